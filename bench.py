@@ -0,0 +1,237 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from telegram import Update
+from telegram.ext import ApplicationBuilder, TypeHandler
+from telegram.request import BaseRequest
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Нагрузочный тест без сети и без SQL Server: N учителей одновременно составляют списки.
+# Запросы к Telegram перехватываются заглушкой, состав классов берётся из SQLite.
+
+
+# Заглушка Telegram Bot API: считает исходящие запросы и отвечает правдоподобными объектами
+class FakeTelegram(BaseRequest):
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._message_id = 0
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit("/", 1)[1]
+        self.calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        params = request_data.json_parameters if request_data else {}
+        if endpoint == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        elif endpoint in ("answerCallbackQuery", "setMyCommands", "setWebhook", "deleteWebhook"):
+            result = True
+        else:
+            self._message_id += 1
+            chat_id = int(params.get("chat_id", 0))
+            result = {"message_id": self._message_id, "date": int(time.time()),
+                      "chat": {"id": chat_id, "type": "private"}, "text": ""}
+            if endpoint == "sendDocument":
+                result["document"] = {"file_id": f"file_{self._message_id}", "file_unique_id": str(self._message_id)}
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+class Teacher:
+    def __init__(self, user_id: int):
+        self.user = {"id": user_id, "is_bot": False, "first_name": f"Учитель {user_id}"}
+        self.update_id = user_id * 1000
+
+    def _next_id(self) -> int:
+        self.update_id += 1
+        return self.update_id
+
+    def message(self, text: str) -> dict:
+        message = {"message_id": self._next_id(), "date": int(time.time()),
+                   "chat": {"id": self.user["id"], "type": "private"}, "from": self.user, "text": text}
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": self.update_id, "message": message}
+
+    def callback(self, data: str) -> dict:
+        update_id = self._next_id()
+        message = {"message_id": 1, "date": int(time.time()),
+                   "chat": {"id": self.user["id"], "type": "private"}, "text": ""}
+        return {"update_id": update_id, "callback_query": {
+            "id": str(update_id), "from": self.user, "chat_instance": "bench", "data": data, "message": message}}
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux возвращает килобайты, macOS — байты
+    return usage / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+
+async def seed_roster(database, classes: int, students: int):
+    for class_id in range(1, classes + 1):
+        await database.execute("INSERT INTO Classes (ClassID, ClassName) VALUES (?, ?)",
+                               class_id, f"{5 + class_id % 7}{'АБВГ'[class_id % 4]}{class_id}")
+        for i in range(students):
+            await database.execute("INSERT INTO Students (LastName, FirstName, ClassID) VALUES (?, ?, ?)",
+                                   f"Фамилия_{class_id}_{i}", f"Имя{i}", class_id)
+
+
+async def run(args):
+    # Бот пишет служебные файлы в текущую папку, поэтому работаем во временной
+    workdir = tempfile.mkdtemp(prefix="bench_")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)
+
+    import db as repo
+    import main
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    database = repo.SqliteDatabase()
+    await seed_roster(database, args.classes, args.students)
+    main.db = database
+    main.roster.db = database
+    await main.roster.load()
+
+    telegram = FakeTelegram(latency=args.latency_ms / 1000)
+    builder = ApplicationBuilder().token("123:bench").request(telegram).get_updates_request(FakeTelegram())
+    if args.rate_limit:
+        builder = builder.rate_limiter(main.outbound_limiter)
+    if args.concurrent:
+        builder = builder.concurrent_updates(main.update_processor)
+    app = builder.build()
+    main.add_handlers(app)
+
+    latencies = defaultdict(list)
+    done: dict[int, asyncio.Event] = {}
+
+    # Отдельная группа обработчиков срабатывает после основных и отмечает обновление обработанным
+    async def mark_done(update, context):
+        done.pop(update.update_id).set()
+
+    app.add_handler(TypeHandler(Update, mark_done), group=1)
+    await app.initialize()
+
+    if args.transport == "webhook":
+        # Обновления приходят по HTTP на локальный вебхук, как от Telegram
+        import httpx
+
+        secret = "bench-secret"
+        await app.updater.start_webhook(listen="127.0.0.1", port=args.webhook_port, url_path="bench",
+                                        secret_token=secret)
+        client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.webhook_port}")
+
+        async def deliver(data: dict):
+            response = await client.post("/bench", json=data, headers={"X-Telegram-Bot-Api-Secret-Token": secret})
+            response.raise_for_status()
+    else:
+        # То же, что делает Application с каждым полученным обновлением
+        async def deliver(data: dict):
+            update = Update.de_json(data, app.bot)
+            asyncio.create_task(app.update_processor.process_update(update, app.process_update(update)))
+
+    async def send(step: str, data: dict):
+        event = done[data["update_id"]] = asyncio.Event()
+        started = time.perf_counter()
+        await deliver(data)
+        await event.wait()
+        latencies[step].append((time.perf_counter() - started) * 1000)
+
+    async def teacher_morning(index: int):
+        teacher = Teacher(10_000 + index)
+        class_id = index % args.classes + 1
+        first_student = (class_id - 1) * args.students + 1
+        await send("start", teacher.message("/start"))
+        await send("menu", teacher.message("📋 МЕНЮ"))
+        await send("choose_class", teacher.message("📜 СОЗДАТЬ СПИСОК"))
+        await send("send_students_buttons", teacher.callback(f"class_{class_id}"))
+        for i in range(min(args.picks, args.students)):
+            page = i // main.PICKER_PAGE_SIZE
+            await send("student_selected", teacher.callback(f"student_{class_id}_{first_student + i}_{page}"))
+        await send("pick_done", teacher.callback("pick_done"))
+        await send("generate_excel", teacher.message("💾 СОХРАНИТЬ И ОТПРАВИТЬ СПИСОК"))
+
+    # Фоновые задачи обработчиков (правки клавиатуры) выполняются только у запущенного приложения
+    await app.start()
+
+    calls_before = sum(telegram.calls.values())
+    started = time.perf_counter()
+    await asyncio.gather(*(teacher_morning(i) for i in range(args.teachers)))
+    elapsed = time.perf_counter() - started
+    outbound = sum(telegram.calls.values()) - calls_before
+
+    if args.transport == "webhook":
+        await client.aclose()
+        await app.updater.stop()
+    await app.stop()
+    await app.shutdown()
+    await main.sessions.close()
+    await main.list_store.close()
+
+    updates = sum(len(v) for v in latencies.values())
+    print(f"Учителей: {args.teachers}, классов: {args.classes}, учеников в классе: {args.students}, "
+          f"отметок на список: {args.picks}, задержка API: {args.latency_ms} мс, "
+          f"доставка: {args.transport}, параллельно: {'да' if args.concurrent else 'нет'}")
+    print(f"{'шаг':<24}{'кол-во':>8}{'p50, мс':>10}{'p99, мс':>10}{'сред., мс':>11}")
+    for step, values in latencies.items():
+        print(f"{step:<24}{len(values):>8}{percentile(values, 0.5):>10.1f}{percentile(values, 0.99):>10.1f}"
+              f"{statistics.mean(values):>11.1f}")
+    print(f"Всего обновлений: {updates} за {elapsed:.2f} с ({updates / elapsed:.0f} обновл./с)")
+    print(f"Исходящих запросов к API: {outbound} ({outbound / args.teachers:.1f} на список): {dict(telegram.calls)}")
+    if args.rate_limit:
+        print(f"Исходящая очередь: {main.outbound_limiter.stats()}")
+    rss = peak_rss_mb()
+    if rss is not None:
+        print(f"Пиковое потребление памяти (RSS): {rss:.1f} МБ")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота: утренний пик составления списков")
+    parser.add_argument("--teachers", type=int, default=30, help="количество одновременных учителей")
+    parser.add_argument("--classes", type=int, default=30, help="количество классов")
+    parser.add_argument("--students", type=int, default=30, help="учеников в классе")
+    parser.add_argument("--picks", type=int, default=20, help="отмеченных учеников в каждом списке")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="имитация задержки Telegram API")
+    parser.add_argument("--concurrent", action="store_true",
+                        help="параллельная обработка разных пользователей (PerUserUpdateProcessor)")
+    parser.add_argument("--transport", choices=("direct", "webhook"), default="direct",
+                        help="передавать обновления напрямую или по HTTP через локальный вебхук")
+    parser.add_argument("--webhook-port", type=int, default=8843, help="порт локального вебхука")
+    parser.add_argument("--rate-limit", action="store_true", help="пропускать запросы через очередь OutboundLimiter")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
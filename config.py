@@ -0,0 +1,105 @@
+import os
+from datetime import datetime, time, tzinfo
+from typing import Optional
+
+# Настройки бота. Значения берутся из переменных окружения, а если их нет — из файла token.env
+# рядом с модулем (строки вида КЛЮЧ=значение, # — комментарий). Переменные окружения важнее файла.
+ENV_FILE = os.environ.get("BOT_ENV_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "token.env"))
+
+
+def read_env_file(path: str) -> dict[str, str]:
+    values = {}
+    try:
+        with open(path, encoding="utf-8-sig") as file:
+            for line in file:
+                line = line.strip()
+                if not line or line.startswith("#") or "=" not in line:
+                    continue
+                key, value = line.split("=", 1)
+                value = value.strip()
+                if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+                    value = value[1:-1]
+                values[key.strip()] = value
+    except FileNotFoundError:
+        pass
+    return values
+
+
+_file_values = read_env_file(ENV_FILE)
+
+
+def get(name: str, default: Optional[str] = None) -> Optional[str]:
+    value = os.environ.get(name)
+    if value is None:
+        value = _file_values.get(name, default)
+    return value
+
+
+def get_int(name: str, default: Optional[int] = None) -> Optional[int]:
+    value = get(name)
+    return int(value) if value else default
+
+
+def get_float(name: str, default: float) -> float:
+    value = get(name)
+    return float(value) if value else default
+
+
+# Часовой пояс школы, например Europe/Moscow. Не задан — часовой пояс компьютера, на котором работает бот
+def get_timezone(name: str) -> tzinfo:
+    value = get(name)
+    if value:
+        from zoneinfo import ZoneInfo
+
+        return ZoneInfo(value)
+    return datetime.now().astimezone().tzinfo
+
+
+# Время суток в формате ЧЧ:ММ в часовом поясе школы: без пояса JobQueue считает время по UTC
+def get_time(name: str, default: str) -> time:
+    return datetime.strptime(get(name) or default, "%H:%M").time().replace(tzinfo=TIMEZONE)
+
+
+BOT_TOKEN = get("BOT_TOKEN")
+ADMIN_CHAT_ID = get_int("ADMIN_CHAT_ID", 6129878481)
+
+# Подключение к SQL Server: целиком строкой DB_CONNECTION_STRING или по частям
+DB_DRIVER = get("DB_DRIVER", "SQL Server")
+DB_SERVER = get("DB_SERVER", "localhost\\SQLEXPRESS")
+DB_NAME = get("DB_NAME", "School12db")
+DB_CONNECTION_STRING = get("DB_CONNECTION_STRING") or (
+    f"DRIVER={{{DB_DRIVER}}};SERVER={DB_SERVER};DATABASE={DB_NAME};Trusted_Connection=yes;"
+)
+DB_POOL_SIZE = get_int("DB_POOL_SIZE", 5)
+# Соединение, простоявшее без дела дольше этого времени, перед выдачей проверяется запросом SELECT 1
+DB_PING_AFTER = get_float("DB_PING_AFTER", 60.0)
+
+# Сколько секунд держать в памяти состав классов и незавершённые списки учителей
+ROSTER_TTL = get_int("ROSTER_TTL", 6 * 60 * 60)
+SESSION_TTL = get_int("SESSION_TTL", 12 * 60 * 60)
+
+# Ежедневный сводный отчёт для столовой и ночная очистка списков старше RETENTION_DAYS дней
+TIMEZONE = get_timezone("TIMEZONE")
+REPORT_TIME = get_time("REPORT_TIME", "09:00")
+RETENTION_TIME = get_time("RETENTION_TIME", "03:00")
+RETENTION_DAYS = get_int("RETENTION_DAYS", 7)
+
+# Сколько обновлений разных пользователей обрабатывать одновременно
+MAX_CONCURRENT_UPDATES = get_int("MAX_CONCURRENT_UPDATES", 64)
+
+# Файлы и папки бота
+USER_FILES_DIR = get("USER_FILES_DIR", "user_files")
+LISTS_DB_PATH = get("LISTS_DB_PATH", "lists.sqlite3")
+SESSIONS_DB_PATH = get("SESSIONS_DB_PATH", "sessions.sqlite3")
+STATE_PATH = get("STATE_PATH", "bot_state.pickle")
+
+# Режим получения обновлений: "polling" или "webhook" (за обратным прокси)
+BOT_MODE = get("BOT_MODE", "polling")
+WEBHOOK_URL = get("WEBHOOK_URL")
+WEBHOOK_LISTEN = get("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = get_int("WEBHOOK_PORT", 8443)
+WEBHOOK_PATH = get("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = get("WEBHOOK_SECRET")
+
+# Порт для метрик в формате Prometheus (не задан — не запускать)
+METRICS_PORT = get_int("METRICS_PORT")
@@ -0,0 +1,218 @@
+import asyncio
+import queue
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, NamedTuple, Optional
+
+from metrics import record_db_time
+
+
+class ClassRow(NamedTuple):
+    class_id: int
+    class_name: str
+
+
+class StudentRow(NamedTuple):
+    student_id: int
+    last_name: str
+    first_name: str
+
+
+def ping(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+    finally:
+        cursor.close()
+
+
+# Ограниченный пул соединений. Соединения создаются по мере необходимости,
+# но одновременно открыто не больше size штук. Соединение, простоявшее без дела
+# дольше ping_after секунд, перед выдачей проверяется и при обрыве открывается заново.
+class ConnectionPool:
+    def __init__(self, connect: Callable, size: int = 5, ping_after: Optional[float] = None):
+        self._connect = connect
+        self._size = size
+        self._ping_after = ping_after
+        self.connects = 0
+        self.reconnects = 0
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._slots = queue.Queue(maxsize=size)
+        for _ in range(size):
+            self._slots.put(None)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def _open(self):
+        conn = self._connect()
+        self.connects += 1
+        return conn
+
+    def _checked(self, conn, released_at: float):
+        if self._ping_after is None or time.monotonic() - released_at < self._ping_after:
+            return conn
+        try:
+            ping(conn)
+            return conn
+        except Exception:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self.reconnects += 1
+        return self._open()
+
+    @contextmanager
+    def acquire(self):
+        self._slots.get()
+        try:
+            try:
+                conn = self._checked(*self._idle.get_nowait())
+            except queue.Empty:
+                conn = self._open()
+            try:
+                yield conn
+            except Exception:
+                # Соединение могло остаться в неизвестном состоянии — закрываем его
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                raise
+            else:
+                self._idle.put_nowait((conn, time.monotonic()))
+        finally:
+            self._slots.put(None)
+
+    def close(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+
+
+# Выполняет запросы в отдельных потоках, чтобы не блокировать цикл событий бота
+class Database:
+    def __init__(self, pool: ConnectionPool):
+        self.pool = pool
+        self._executor = ThreadPoolExecutor(max_workers=pool.size, thread_name_prefix="db")
+
+    def _execute(self, sql: str, params: tuple, fetch: str):
+        with self.pool.acquire() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(sql, params)
+                if fetch == "all":
+                    return cursor.fetchall()
+                if fetch == "one":
+                    return cursor.fetchone()
+                conn.commit()
+                return cursor.rowcount
+            finally:
+                cursor.close()
+
+    async def _run(self, sql: str, params: tuple, fetch: str):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._executor, self._execute, sql, params, fetch)
+        finally:
+            record_db_time(time.perf_counter() - started)
+
+    async def fetchall(self, sql: str, *params):
+        return await self._run(sql, params, "all")
+
+    async def fetchone(self, sql: str, *params):
+        return await self._run(sql, params, "one")
+
+    async def execute(self, sql: str, *params) -> int:
+        return await self._run(sql, params, "none")
+
+    def _transaction(self, fn):
+        with self.pool.acquire() as conn:
+            try:
+                result = fn(conn)
+            except Exception:
+                conn.rollback()
+                raise
+            conn.commit()
+            return result
+
+    # Выполняет fn(conn) в одной транзакции: либо применяется всё, либо ничего
+    async def transaction(self, fn):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._executor, self._transaction, fn)
+        finally:
+            record_db_time(time.perf_counter() - started)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.pool.close()
+
+
+# Репозиторий классов и учеников
+async def get_classes(db: Database) -> list[ClassRow]:
+    rows = await db.fetchall("SELECT ClassID, ClassName FROM Classes")
+    return [ClassRow(r[0], r[1]) for r in rows]
+
+
+async def get_all_students(db: Database) -> list[tuple[int, StudentRow]]:
+    rows = await db.fetchall("SELECT ClassID, StudentID, LastName, FirstName FROM Students ORDER BY ClassID")
+    return [(r[0], StudentRow(r[1], r[2], r[3])) for r in rows]
+
+
+# Подключение к SQL Server не открывается, пока не понадобится первому запросу
+def sql_server_database(connection_string: str, pool_size: int = 5, ping_after: Optional[float] = 60.0) -> Database:
+    def connect():
+        # Драйвер загружается при первом подключении, чтобы модуль импортировался без ODBC
+        import pyodbc
+
+        return pyodbc.connect(connection_string)
+
+    return Database(ConnectionPool(connect, size=pool_size, ping_after=ping_after))
+
+
+# Замена SQL Server на SQLite для нагрузочного тестирования без живой базы
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS Classes (
+    ClassID INTEGER PRIMARY KEY,
+    ClassName TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS Students (
+    StudentID INTEGER PRIMARY KEY,
+    LastName TEXT NOT NULL,
+    FirstName TEXT NOT NULL,
+    ClassID INTEGER NOT NULL REFERENCES Classes(ClassID)
+);
+CREATE INDEX IF NOT EXISTS ix_students_class ON Students(ClassID);
+"""
+
+
+class SqliteDatabase(Database):
+    def __init__(self, path: str = ":memory:", pool_size: int = 5):
+        if path == ":memory:":
+            # Общая in-memory база для всех соединений пула
+            path = f"file:roster_{id(self)}?mode=memory&cache=shared"
+        uri = path.startswith("file:")
+
+        def connect():
+            return sqlite3.connect(path, uri=uri, check_same_thread=False)
+
+        # Держим одно соединение открытым, иначе in-memory база исчезнет
+        self._keeper = connect()
+        self._keeper.executescript(SQLITE_SCHEMA)
+        self._keeper.commit()
+        super().__init__(ConnectionPool(connect, size=pool_size))
+
+    def close(self):
+        super().close()
+        self._keeper.close()
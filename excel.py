@@ -0,0 +1,170 @@
+import asyncio
+import importlib
+import io
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+
+# openpyxl импортируется при сборке первой книги: он заметно замедляет запуск бота
+# Отдельный пул для сборки xlsx, чтобы запись книги не останавливала обработку нажатий
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="excel")
+
+
+# Импорт openpyxl в фоне, чтобы первый список не ждал загрузки библиотеки
+def preload():
+    _executor.submit(importlib.import_module, "openpyxl")
+
+
+def create_user_folder(user_id):
+    folder_path = os.path.join(config.USER_FILES_DIR, str(user_id))
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path)
+    return folder_path
+
+
+# Название класса может содержать символы, недопустимые в имени файла (например, «5/А»)
+def list_file_name(class_name: str, list_date: str) -> str:
+    safe_name = re.sub(r'[\\/:*?"<>|\x00-\x1f]', "-", class_name).strip(". ") or "Класс"
+    return f"{safe_name}_{list_date}.xlsx"
+
+
+def _bold_row(ws, titles):
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    cells = []
+    for title in titles:
+        cell = WriteOnlyCell(ws, value=title)
+        cell.font = Font(bold=True)
+        cells.append(cell)
+    return cells
+
+
+# Название листа из названия класса: без запрещённых в Excel символов, не длиннее 31 символа
+# и не совпадающее (без учёта регистра) с уже занятыми названиями
+def _sheet_title(name: str, used: set[str]) -> str:
+    base = re.sub(r"[\\/?*\[\]:]", "-", name).strip("' ") or "Класс"
+    title = base[:31]
+    number = 1
+    while title.lower() in used:
+        number += 1
+        suffix = f" ({number})"
+        title = base[:31 - len(suffix)] + suffix
+    used.add(title.lower())
+    return title
+
+
+# Собирает список класса в памяти потоковым (write-only) способом и возвращает байты xlsx
+def render_list(students_list) -> bytes:
+    import openpyxl
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet()
+
+    ws.column_dimensions["A"].width = 20
+    ws.column_dimensions["B"].width = 20
+
+    ws.append(_bold_row(ws, ["Фамилия ученика", "Имя ученика"]))
+
+    for student in students_list:
+        ws.append([student.last_name, student.first_name])
+
+    ws.append(["Итого", len(students_list)])
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+# Сводный отчёт за день: лист «Итого» с количеством по классам и по листу на каждый класс
+def render_report(report_date: str, entries) -> bytes:
+    import openpyxl
+
+    wb = openpyxl.Workbook(write_only=True)
+
+    summary = wb.create_sheet("Итого")
+    used_titles = {"итого"}
+    summary.column_dimensions["A"].width = 20
+    summary.column_dimensions["B"].width = 20
+    summary.column_dimensions["C"].width = 20
+    summary.append([f"Питание на {report_date}"])
+    summary.append(_bold_row(summary, ["Класс", "Количество", "Время списка"]))
+    total = 0
+    for entry in entries:
+        summary.append([entry.class_name, len(entry.students), entry.created_at[11:16]])
+        total += len(entry.students)
+    summary.append(_bold_row(summary, ["Итого", total]))
+
+    for entry in entries:
+        ws = wb.create_sheet(_sheet_title(entry.class_name, used_titles))
+        ws.column_dimensions["A"].width = 20
+        ws.column_dimensions["B"].width = 20
+        ws.append(_bold_row(ws, ["Фамилия ученика", "Имя ученика"]))
+        for student in entry.students:
+            ws.append([student.last_name, student.first_name])
+        ws.append(["Итого", len(entry.students)])
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+# Статистика питания за месяц: лист по классам и лист по ученикам
+def render_meal_stats(month: str, classes, students) -> bytes:
+    import openpyxl
+
+    wb = openpyxl.Workbook(write_only=True)
+
+    by_class = wb.create_sheet("Классы")
+    by_class.column_dimensions["A"].width = 20
+    by_class.column_dimensions["B"].width = 20
+    by_class.column_dimensions["C"].width = 20
+    by_class.append([f"Питание за {month}"])
+    by_class.append(_bold_row(by_class, ["Класс", "Дней", "Порций"]))
+    for row in classes:
+        by_class.append([row.class_name, row.days, row.meals])
+    by_class.append(_bold_row(by_class, ["Итого", "", sum(row.meals for row in classes)]))
+
+    by_student = wb.create_sheet("Ученики")
+    by_student.column_dimensions["A"].width = 20
+    by_student.column_dimensions["B"].width = 20
+    by_student.column_dimensions["C"].width = 20
+    by_student.column_dimensions["D"].width = 20
+    by_student.append(_bold_row(by_student, ["Класс", "Фамилия ученика", "Имя ученика", "Порций"]))
+    for row in students:
+        by_student.append([row.class_name, row.last_name, row.first_name, row.meals])
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+# Архивная копия на диске: старый список этого класса за ту же дату перезаписывается новым
+def save_list(user_id, class_name: str, list_date: str, data: bytes) -> str:
+    folder_path = create_user_folder(user_id)
+    file_path = os.path.join(folder_path, list_file_name(class_name, list_date))
+    with open(file_path, "wb") as file:
+        file.write(data)
+    return file_path
+
+
+async def render_list_async(students_list) -> bytes:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, render_list, list(students_list))
+
+
+async def render_report_async(report_date: str, entries) -> bytes:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, render_report, report_date, entries)
+
+
+async def render_meal_stats_async(month: str, classes, students) -> bytes:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, render_meal_stats, month, classes, students)
+
+
+async def save_list_async(user_id, class_name: str, list_date: str, data: bytes) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, save_list, user_id, class_name, list_date, data)
@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import os
+import re
+from datetime import datetime
+
+from db import StudentRow
+from roster import RosterCache
+from saved_lists import ListStore
+
+logger = logging.getLogger(__name__)
+
+# Имя файла старого формата: <класс>_<ГГГГ-ММ-ДД>.xlsx
+FILE_NAME = re.compile(r"^(?P<class_name>.+)_(?P<list_date>\d{4}-\d{2}-\d{2})\.xlsx$")
+
+
+def _read_names(file_path: str) -> list[tuple[str, str]]:
+    import openpyxl
+
+    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        names = []
+        for row in wb.active.iter_rows(min_row=2, max_col=2, values_only=True):
+            last_name, first_name = (list(row) + [None, None])[:2]
+            if last_name is None or first_name is None or last_name == "Итого":
+                continue
+            names.append((str(last_name).strip(), str(first_name).strip()))
+        return names
+    finally:
+        wb.close()
+
+
+def _scan(base_folder: str, known: set[str]) -> list[tuple[int, str, str, str, str]]:
+    found = []
+    if not os.path.isdir(base_folder):
+        return found
+    for user_folder in os.listdir(base_folder):
+        folder = os.path.join(base_folder, user_folder)
+        if not user_folder.isdigit() or not os.path.isdir(folder):
+            continue
+        for file_name in os.listdir(folder):
+            match = FILE_NAME.match(file_name)
+            file_path = os.path.join(folder, file_name)
+            if match and file_path not in known:
+                found.append((int(user_folder), match["class_name"], match["list_date"], file_name, file_path))
+    return found
+
+
+# Однократный перенос списков, сохранённых до появления хранилища, из user_files/<id>/<класс>_<дата>.xlsx.
+# Ученики сопоставляются с составом класса по фамилии и имени. Уже перенесённые файлы и файлы,
+# которые перенести не удалось, запоминаются в хранилище и при следующих запусках не читаются.
+async def migrate_user_files(store: ListStore, roster: RosterCache, base_folder: str) -> int:
+    known = await store.file_paths() | await store.skipped_files()
+    files = await asyncio.to_thread(_scan, base_folder, known)
+    imported = 0
+    for user_id, class_name, list_date, file_name, file_path in files:
+        try:
+            names = await asyncio.to_thread(_read_names, file_path)
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать старый список {file_path}: {e}")
+            await store.skip_file(file_path, f"ошибка чтения: {e}")
+            continue
+
+        class_id = await roster.class_id(class_name)
+        available = list(await roster.students(class_id)) if class_id is not None else []
+        students, missing = [], []
+        for last_name, first_name in names:
+            student = next((s for s in available if (s.last_name, s.first_name) == (last_name, first_name)), None)
+            if student is None:
+                missing.append(f"{last_name} {first_name}")
+                continue
+            available.remove(student)
+            students.append(StudentRow(*student))
+        if missing:
+            logger.warning(f"{file_path}: нет в составе класса {class_name}: {', '.join(missing)}")
+        if not students:
+            await store.skip_file(file_path, "нет учеников из состава класса")
+            continue
+
+        created_at = datetime.fromtimestamp(os.path.getmtime(file_path)).isoformat(timespec="seconds")
+        await store.import_list(user_id, class_id, class_name, list_date, students, created_at, file_path)
+        imported += 1
+
+    if files:
+        logger.info(f"Перенесено старых списков: {imported} из {len(files)}")
+    return imported
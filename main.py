@@ -1,180 +1,173 @@
-import pyodbc
-import os
-import re
+from time import perf_counter
+
+# Отсчёт холодного старта: от начала импорта до готовности принимать обновления
+IMPORT_STARTED = perf_counter()
+
 import asyncio
-import openpyxl
-from openpyxl.styles import Font
+import io
+import os
+from typing import Optional
 from telegram import Update, ReplyKeyboardMarkup, InlineKeyboardMarkup, InlineKeyboardButton
-from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
-import nest_asyncio
-from datetime import datetime, timedelta
+from telegram.error import BadRequest
+from telegram.ext import ApplicationBuilder, PicklePersistence, PersistenceInput, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
+from datetime import datetime
 import logging
 
+import config
+import db as repo
+import excel
+import metrics
+import roster_import
+from legacy_lists import migrate_user_files
+from outbound import OutboundLimiter
+from report import build_daily_report, build_monthly_report
+from retention import RetentionSweeper
+from roster import RosterCache
+from router import Router
+from saved_lists import ListStore
+from sessions import Session, SqliteSessionStore
+from update_processor import PerUserUpdateProcessor
+
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger()
 
-nest_asyncio.apply()
-
-# Подключение к базе данных
-conn = pyodbc.connect(
-    "DRIVER={SQL Server};"
-    "SERVER=localhost\\SQLEXPRESS;"
-    "DATABASE=School12db;"
-    "Trusted_Connection=yes;"
-)
-cursor = conn.cursor()
-
-# Словарь для хранения временного списка выбранных учеников пользователями
-user_selected_students = {}
-BASE_FOLDER = "C:\\Users\\ASUS\\PycharmProjects\\еп\\user_files"
-
-
-def delete_old_user_files(user_id: int, base_folder: str, days_old: int = 7):
-    user_folder = os.path.join(base_folder, str(user_id))
-    date_pattern = re.compile(r'\d{1,2}[А-Яа-я_]*_(\d{4})-(\d{2})-(\d{2})')
-    today = datetime.today()
-    deleted_files = []
-    files_in_folder = os.listdir(user_folder)
-    logger.info(f"Файлы в папке пользователя {user_id}: {files_in_folder}")
-
-    for filename in files_in_folder:
-        match = date_pattern.search(filename)
-        if match:
-            year, month, day = map(int, match.groups())
-            file_date = datetime(year, month, day)
-            if today - file_date > timedelta(days=days_old):
-                file_path = os.path.join(user_folder, filename)
-                os.remove(file_path)
-                deleted_files.append(filename)
-                logger.info(f"Файл {filename} удален.")
-    if deleted_files:
-        logger.info(f"Удалены старые файлы: {', '.join(deleted_files)}")
-    else:
-        logger.info(f"Нет старых файлов для удаления в папке пользователя {user_id}.")
+# Подключение к базе данных: пул соединений, запросы выполняются вне цикла событий.
+# Соединения открываются при первом запросе, поэтому модуль импортируется без живой базы.
+db = repo.sql_server_database(config.DB_CONNECTION_STRING, pool_size=config.DB_POOL_SIZE,
+                              ping_after=config.DB_PING_AFTER)
+
+# Состав классов меняется редко, поэтому держим его в памяти
+roster = RosterCache(db, ttl=config.ROSTER_TTL)
+
+# Сохранённые списки: структурированные записи с индексами, xlsx собирается по требованию
+list_store = ListStore(config.LISTS_DB_PATH)
+
+# Списки старше config.RETENTION_DAYS дней удаляются ночной очисткой
+retention = RetentionSweeper(list_store, retention_days=config.RETENTION_DAYS, files_dir=config.USER_FILES_DIR)
+
+# Таблица маршрутов для кнопок reply-клавиатур: текст кнопки -> обработчик
+router = Router()
 
-    return deleted_files
+# Очередь исходящих сообщений с ограничением частоты по чату и в целом
+outbound_limiter = OutboundLimiter(overall_rate=30, chat_rate=1, chat_burst=3, max_retries=3)
 
+# Обновления разных пользователей обрабатываются параллельно, одного — по очереди
+update_processor = PerUserUpdateProcessor(config.MAX_CONCURRENT_UPDATES)
 
+# Сколько учеников показывать на одной странице выбора
+PICKER_PAGE_SIZE = 10
+
+# Ответ на нажатие кнопки из сообщения, отправленного прежней версией бота
+STALE_BUTTON = "⌛ Кнопка устарела. Откройте список заново."
+
+# Хранилище временных списков выбранных учеников пользователями.
+# Для каждого пользователя — выбранный класс и упорядоченное множество StudentID (Session).
+# Списки переживают перезапуск бота, а давно не используемые вытесняются из памяти.
+sessions = SqliteSessionStore(config.SESSIONS_DB_PATH, maxsize=1000, ttl=config.SESSION_TTL, flush_delay=5.0)
+
+# Время холодного старта, с (заполняется при запуске)
+startup_seconds = None
+# Перенос старых списков идёт в фоне и не задерживает запуск
+migration_task: Optional[asyncio.Task] = None
+
+
+@router.route("📂 ПРОШЛЫЕ СПИСКИ")
 async def view_previous_lists(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
-    folder_path = f"user_files/{user_id}"
+    records = await list_store.user_lists(user_id)
 
-    if not os.path.exists(folder_path) or not os.listdir(folder_path):
+    if not records:
         await update.message.reply_text("❌ У вас нет сохраненных списков.")
         return
 
-    files = os.listdir(folder_path)
     keyboard = [
-        [InlineKeyboardButton(file, callback_data=f"view_file|{file}")] for file in files
+        [InlineKeyboardButton(f"{r.class_name} — {r.list_date}", callback_data=f"view_list_{r.list_id}")]
+        for r in records
     ]
 
     reply_markup = InlineKeyboardMarkup(keyboard)
     await update.message.reply_text("Выберите список, который хотите просмотреть:", reply_markup=reply_markup)
 
 
-def create_user_folder(user_id):
-    folder_path = f"user_files/{user_id}"
-    if not os.path.exists(folder_path):
-        os.makedirs(folder_path)
-    return folder_path
-
-
-# Функция для создания или обновления Excel
-def create_excel(class_name, students_list, user_id):
-    folder_path = create_user_folder(user_id)
-    today_date = datetime.now().strftime("%Y-%m-%d")
-
-    for file in os.listdir(folder_path):
-        if file.startswith(f"{class_name}_{today_date}"):
-            os.remove(os.path.join(folder_path, file))
-
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    headers = ["Фамилия ученика", "Имя ученика"]
-    ws.append(headers)
-
-    for cell in ws[1]:
-        cell.font = Font(bold=True)
-
-    ws.column_dimensions["A"].width = 20
-    ws.column_dimensions["B"].width = 20
+# Отправка сохранённого списка: по file_id, если он уже загружался, иначе xlsx собирается заново
+async def send_list_document(message, record):
+    if record.file_id:
+        await message.reply_document(document=record.file_id)
+        return
 
-    for student in students_list:
-        ws.append([student["LastName"], student["FirstName"]])
+    data = await excel.render_list_async(record.students)
+    file_name = excel.list_file_name(record.class_name, record.list_date)
+    sent = await message.reply_document(document=data, filename=file_name)
+    await list_store.set_file_id(record.list_id, sent.document.file_id)
 
-    ws.append(["Итого", len(students_list)])
 
-    file_name = f"{class_name}_{today_date}.xlsx"
-    file_path = os.path.join(folder_path, file_name)
-    wb.save(file_path)
-    return file_path
+async def send_selected_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    values = parse_callback(query.data, "view_list_", 1)
+    if values is None:
+        await query.answer(STALE_BUTTON)
+        return
+    await query.answer()
+    await show_list(query, context, await list_store.get(values[0]))
 
 
-async def send_selected_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
+# Кнопки view_file|<имя файла> из сообщений, отправленных до появления хранилища списков:
+# старые файлы перенесены в хранилище при запуске и находятся по пути
+async def send_legacy_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    file_name = query.data.split("|")[1]
+    file_name = os.path.basename(query.data.split("|", 1)[1])
+    file_path = os.path.join(config.USER_FILES_DIR, str(query.from_user.id), file_name)
+    await show_list(query, context, await list_store.find_by_path(query.from_user.id, file_path))
 
-    user_id = query.from_user.id
-    folder_path = f"user_files/{user_id}"
-    file_path = os.path.join(folder_path, file_name)
 
-    if not os.path.exists(file_path):
-        await query.message.reply_text("❌ Этот файл не существует.")
+async def show_list(query, context: ContextTypes.DEFAULT_TYPE, record):
+    user_id = query.from_user.id
+    if record is None or record.user_id != user_id:
+        await query.message.reply_text("❌ Этот список не существует.")
         return
 
     try:
-        wb = openpyxl.load_workbook(file_path)
-        ws = wb.active
-
-        students = []
-        for row in ws.iter_rows(min_row=2, max_col=2, values_only=True):
-            last_name, first_name = row
-            if last_name is None or first_name is None:
-                continue
-            if last_name == "Итого":
-                continue
-            students.append({"LastName": last_name, "FirstName": first_name})
-
+        students = record.students
         if not students:
             await query.message.reply_text("❌ В этом списке нет учеников.")
             return
 
-        class_name, date_part = file_name.replace(".xlsx", "").split("_", 1)
-        context.user_data["selected_class_name"] = class_name
-        user_selected_students[user_id] = students
+        class_id = record.class_id if record.class_id is not None else await roster.class_id(record.class_name)
+        await sessions.set(user_id, Session(class_id, dict.fromkeys(s.student_id for s in students)))
 
-        student_text = "\n".join([f"- {s['LastName']} {s['FirstName']}" for s in students])
-        message_text = f"📋 **Класс:** {class_name}\n📅 **Дата:** {date_part}\n\n**Ученики:**\n{student_text}"
+        student_text = "\n".join([f"- {s.last_name} {s.first_name}" for s in students])
+        message_text = (f"📋 **Класс:** {record.class_name}\n📅 **Дата:** {record.list_date}\n\n"
+                        f"**Ученики:**\n{student_text}")
         await query.message.reply_text(message_text, parse_mode="Markdown")
+
+        await send_list_document(query.message, record)
+
         keyboard = [["✏️ РЕДАКТИРОВАТЬ СПИСОК", "💾 СОХРАНИТЬ И ОТПРАВИТЬ СПИСОК"], ["🔙 Назад"]]
         reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
         await query.message.reply_text("Вы можете отредактировать список или сохранить его как новый.",
                                        reply_markup=reply_markup)
 
     except Exception as e:
-        logger.error(f"Ошибка при чтении файла: {e}")
+        logger.error(f"Ошибка при открытии списка {record.list_id}: {e}")
         await query.message.reply_text("⚠️ Произошла ошибка при открытии списка.")
 
 
 # Стартовое сообщение
+@router.route("🔙 Назад")
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
     user_name = update.message.from_user.full_name
     logger.info(f"Start command received from {user_name} (ID: {user_id})")
 
-    # Проверка и удаление старых файлов перед началом работы
-    deleted_files = delete_old_user_files(user_id, BASE_FOLDER, days_old=7)
-    if deleted_files:
-        logger.info(f"Удалены старые файлы для пользователя {user_name} (ID: {user_id}): {', '.join(deleted_files)}")
-
     keyboard = [["📋 МЕНЮ"], ["ℹ️ИНСТРУКЦИЯ"]]
     reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
     await update.message.reply_text("👋 Добро пожаловать! Выберите действие:", reply_markup=reply_markup)
 
 
+@router.route("📋 МЕНЮ")
 async def menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_name = update.message.from_user.full_name
     logger.info(f"Menu command received from {user_name} (ID: {update.message.from_user.id})")
@@ -184,6 +177,7 @@ async def menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("📋 Главное меню", reply_markup=reply_markup)
 
 
+@router.route("ℹ️ИНСТРУКЦИЯ")
 async def info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_name = update.message.from_user.full_name
     logger.info(f"Infooooo command received from {user_name} (ID: {update.message.from_user.id})")
@@ -211,12 +205,12 @@ async def info(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 # Выбор класса
+@router.route("📜 СОЗДАТЬ СПИСОК")
 async def choose_class(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    cursor.execute("SELECT ClassID, ClassName FROM Classes")
-    classes = cursor.fetchall()
+    classes = await roster.classes()
 
     keyboard = [
-        [InlineKeyboardButton(c.ClassName, callback_data=f"class_{c.ClassID}")] for c in classes
+        [InlineKeyboardButton(c.class_name, callback_data=f"class_{c.class_id}")] for c in classes
     ]
 
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -226,27 +220,24 @@ async def choose_class(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def send_students_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
+    values = parse_callback(query.data, "class_", 1)
+    if values is None:
+        await query.answer(STALE_BUTTON)
+        return
     await query.answer()
-    class_id = query.data.split("_")[1]
+    class_id = values[0]
 
-    cursor.execute("SELECT ClassName FROM Classes WHERE ClassID=?", class_id)
-    class_name = cursor.fetchone()[0]
-    context.user_data["selected_class_name"] = class_name
+    class_name = await roster.class_name(class_id)
 
-    cursor.execute("SELECT LastName, FirstName FROM Students WHERE ClassID=?", class_id)
-    students = cursor.fetchall()
+    students = await roster.students(class_id)
     if not students:
         await query.message.reply_text("❌ В этом классе нет учеников.")  # Отладочное сообщение
         return
 
     user_id = query.from_user.id
-    user_selected_students[user_id] = []
+    await sessions.set(user_id, Session(class_id, {}))
 
-    keyboard = [
-        [InlineKeyboardButton(f"{s[0]} {s[1]}", callback_data=f"student_{s[0]}_{s[1]}")] for s in students
-    ]
-
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = build_picker(class_id, students, {}, page=0)
     await query.message.reply_text(f"Вы выбрали класс: {class_name}. Теперь выберите учеников:",
                                    reply_markup=reply_markup)
 
@@ -256,34 +247,157 @@ async def send_students_buttons(update: Update, context: ContextTypes.DEFAULT_TY
     await query.message.reply_text("Выберите действие:", reply_markup=action_keyboard)
 
 
-# Добавление выбранных учеников
+# Клавиатура выбора учеников: отметки ✅/⬜, страницы, «выбрать всех», «очистить» и «готово».
+# Кнопки несут ID класса, чтобы нажатие в старом сообщении другого класса не меняло текущий список.
+def build_picker(class_id: int, students, selected, page: int) -> InlineKeyboardMarkup:
+    pages = max(1, (len(students) + PICKER_PAGE_SIZE - 1) // PICKER_PAGE_SIZE)
+    page = min(max(page, 0), pages - 1)
+    start_index = page * PICKER_PAGE_SIZE
+
+    keyboard = [
+        [InlineKeyboardButton(f"{'✅' if s.student_id in selected else '⬜'} {s.last_name} {s.first_name}",
+                              callback_data=f"student_{class_id}_{s.student_id}_{page}")]
+        for s in students[start_index:start_index + PICKER_PAGE_SIZE]
+    ]
+    if pages > 1:
+        keyboard.append([
+            InlineKeyboardButton("◀️", callback_data=f"page_{class_id}_{(page - 1) % pages}"),
+            InlineKeyboardButton(f"{page + 1}/{pages}", callback_data="pick_noop"),
+            InlineKeyboardButton("▶️", callback_data=f"page_{class_id}_{(page + 1) % pages}"),
+        ])
+    keyboard.append([
+        InlineKeyboardButton("☑️ Выбрать всех", callback_data=f"pick_all_{class_id}_{page}"),
+        InlineKeyboardButton("✖️ Очистить", callback_data=f"pick_clear_{class_id}_{page}"),
+    ])
+    keyboard.append([InlineKeyboardButton(f"✔️ Готово ({len(selected)})", callback_data="pick_done")])
+    return InlineKeyboardMarkup(keyboard)
+
+
+# Обновляем клавиатуру в том же сообщении вместо отправки нового
+async def update_picker(query, context: ContextTypes.DEFAULT_TYPE, class_id: int, page: int):
+    students = await roster.students(class_id)
+    selected = (await sessions.get(query.from_user.id)).selected
+    # Правку не ждём: пока она стоит в исходящей очереди, следующее нажатие заменит её более свежей
+    context.application.create_task(edit_picker(query, build_picker(class_id, students, selected, page)))
+
+
+async def edit_picker(query, reply_markup):
+    try:
+        await query.edit_message_reply_markup(reply_markup=reply_markup)
+    except BadRequest as e:
+        # Повторное нажатие на ту же кнопку: клавиатура не изменилась
+        if "not modified" not in str(e).lower():
+            raise
+
+
+# Числа из callback_data после префикса; None — кнопка прежней версии бота или повреждённые данные
+def parse_callback(data: str, prefix: str, count: int) -> Optional[list[int]]:
+    if not data.startswith(prefix):
+        return None
+    parts = data[len(prefix):].split("_")
+    if len(parts) != count or not all(part.isdigit() for part in parts):
+        return None
+    return [int(part) for part in parts]
+
+
+# Кнопка выбора относится к классу, список которого сейчас составляется
+async def check_picker_class(query, class_id: int) -> bool:
+    if class_id != (await sessions.get(query.from_user.id)).class_id:
+        await query.answer("❌ Это сообщение относится к другому классу. Выберите класс заново.")
+        return False
+    return True
+
+
+# Добавление или удаление ученика из списка
 async def student_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
     user_id = query.from_user.id
-    selected_student = query.data.split("_")[1:]
-    if user_id not in user_selected_students:
-        user_selected_students[user_id] = []
-    student = {"LastName": selected_student[0], "FirstName": selected_student[1]}
-    if student not in user_selected_students[user_id]:
-        user_selected_students[user_id].append(student)
+    # Кнопки прежних версий бота: student_<Фамилия>_<Имя> или student_<StudentID>_<страница>
+    values = parse_callback(query.data, "student_", 3)
+    if values is None:
+        await query.answer(STALE_BUTTON)
+        return
+    class_id, student_id, page = values
+    if not await check_picker_class(query, class_id):
+        return
+
+    student = next((s for s in await roster.students(class_id) if s.student_id == student_id), None)
+    if student is None:
+        await query.answer("❌ Этот ученик не найден в классе.")
+        return
+
+    session = await sessions.get(user_id)
+    if student.student_id in session.selected:
+        del session.selected[student.student_id]
+        await query.answer(f"Удалён: {student.last_name} {student.first_name}")
+    else:
+        session.selected[student.student_id] = None
+        await query.answer(f"Добавлен: {student.last_name} {student.first_name}")
+    await sessions.set(user_id, session)
 
     user_name = query.from_user.full_name
-    logger.info(f"Student {selected_student[0]} {selected_student[1]} selected by {user_name} (ID: {user_id})")
+    logger.info(f"Student {student.last_name} {student.first_name} toggled by {user_name} (ID: {user_id})")
+
+    await update_picker(query, context, class_id, page)
+
+
+async def picker_action(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    user_id = query.from_user.id
+    action = query.data
 
-    await query.message.reply_text(f"Вы добавили ученика: {selected_student[0]} {selected_student[1]}")
+    if action == "pick_noop":
+        await query.answer()
+        return
+
+    if action == "pick_done":
+        await query.answer()
+        students = await get_selected_students(user_id)
+        if not students:
+            await query.edit_message_text("❌ Список пуст.")
+            return
+        student_list = "\n".join([f"{s.last_name} {s.first_name}" for s in students])
+        await query.edit_message_text(f"📄 Выбрано учеников: {len(students)}\n{student_list}\n\n"
+                                      f"Нажмите «💾 СОХРАНИТЬ И ОТПРАВИТЬ СПИСОК», чтобы отправить список.")
+        return
+
+    prefix = next((p for p in ("page_", "pick_all_", "pick_clear_") if action.startswith(p)), "")
+    values = parse_callback(action, prefix, 2) if prefix else None
+    if values is None:
+        await query.answer(STALE_BUTTON)
+        return
+    class_id, page = values
+    if not await check_picker_class(query, class_id):
+        return
+    await query.answer()
+
+    if prefix == "pick_all_":
+        session = await sessions.get(user_id)
+        session.selected.update(dict.fromkeys(s.student_id for s in await roster.students(class_id)))
+        await sessions.set(user_id, session)
+    elif prefix == "pick_clear_":
+        await sessions.set(user_id, Session(class_id, {}))
+
+    await update_picker(query, context, class_id, page)
+
+
+async def get_selected_students(user_id: int) -> list[repo.StudentRow]:
+    students_by_id = (await roster.snapshot()).students_by_id
+    return [students_by_id[i] for i in (await sessions.get(user_id)).selected if i in students_by_id]
 
 
 # Просмотр текущего списка
+@router.route("📄 ПРОСМОТРЕТЬ ТЕКУЩИЙ СПИСОК")
 async def view_current_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
-    if user_id not in user_selected_students or not user_selected_students[user_id]:
+    if not (await sessions.get(user_id)).selected:
         await update.message.reply_text("❌ Список пуст.")
         return
-    student_list = "\n".join([f"{s['LastName']} {s['FirstName']}" for s in user_selected_students[user_id]])
+    student_list = "\n".join([f"{s.last_name} {s.first_name}" for s in await get_selected_students(user_id)])
     await update.message.reply_text(f"📄 Текущий список:\n{student_list}")
 
 
+@router.route("✏️ РЕДАКТИРОВАТЬ СПИСОК")
 async def edit_student_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyboard = [
         [InlineKeyboardButton("➕ Добавить ученика", callback_data="edit_add_student")],
@@ -299,129 +413,388 @@ async def handle_edit_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     action = query.data
 
     if action == "edit_add_student":
-        class_name = context.user_data.get("selected_class_name")
+        session = await sessions.get(query.from_user.id)
+        class_name = await roster.class_name(session.class_id) if session.class_id is not None else None
         if not class_name:
             await query.message.reply_text("❌ Класс не выбран.")
             return
 
-        cursor.execute("SELECT ClassID FROM Classes WHERE ClassName=?", class_name)
-        result = cursor.fetchone()
-        if result:
-            class_id = result[0]
-
-
-            cursor.execute("SELECT LastName, FirstName FROM Students WHERE ClassID=?", class_id)
-            students = cursor.fetchall()
-
-            if not students:
-                await query.message.reply_text("❌ В этом классе нет учеников.")
-                return
-
-            keyboard = [
-                [InlineKeyboardButton(f"{s[0]} {s[1]}", callback_data=f"student_{s[0]}_{s[1]}")] for s in students
-            ]
+        students = await roster.students(session.class_id)
+        if not students:
+            await query.message.reply_text("❌ В этом классе нет учеников.")
+            return
 
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.message.reply_text(f"Выберите ученика для добавления в класс {class_name}:",
-                                           reply_markup=reply_markup)
+        reply_markup = build_picker(session.class_id, students, session.selected, page=0)
+        await query.edit_message_text(f"Выберите учеников для добавления в класс {class_name}:",
+                                      reply_markup=reply_markup)
     elif action == "edit_remove_student":
         user_id = query.from_user.id
-        if user_id not in user_selected_students or not user_selected_students[user_id]:
+        if not (await sessions.get(user_id)).selected:
             await query.message.reply_text("❌ Список пуст.")
             return
 
-        student_list = user_selected_students[user_id]
-        keyboard = [
-            [InlineKeyboardButton(f"Удалить {s['LastName']} {s['FirstName']}",
-                                  callback_data=f"remove_student_{s['LastName']}_{s['FirstName']}")]
-            for s in student_list
-        ]
+        reply_markup = build_remove_keyboard(await get_selected_students(user_id))
+        await query.edit_message_text("Выберите ученика для удаления:", reply_markup=reply_markup)
 
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.message.reply_text("Выберите ученика для удаления:", reply_markup=reply_markup)
+
+def build_remove_keyboard(student_list) -> InlineKeyboardMarkup:
+    keyboard = [
+        [InlineKeyboardButton(f"Удалить {s.last_name} {s.first_name}",
+                              callback_data=f"remove_student_{s.student_id}")]
+        for s in student_list
+    ]
+    return InlineKeyboardMarkup(keyboard)
 
 
 async def remove_student(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
     user_id = query.from_user.id
-    student_list = user_selected_students.get(user_id, [])
-    if not student_list:
-        await query.message.reply_text("❌ Список пуст. Некого удалять.")
+    # Кнопки прежних версий бота содержат фамилию и имя вместо StudentID
+    values = parse_callback(query.data, "remove_student_", 1)
+    if values is None:
+        await query.answer(STALE_BUTTON)
         return
+    student_id = values[0]
 
-    student_to_remove = query.data.split("_")[2:]
-    student_to_remove = {"LastName": student_to_remove[0], "FirstName": student_to_remove[1]}
-
-    if student_to_remove in student_list:
-        student_list.remove(student_to_remove)
-        user_selected_students[user_id] = student_list
-        total_students = len(student_list)
-        student_list.append({"LastName": "Итого", "FirstName": total_students})
+    session = await sessions.get(user_id)
+    student_ids = session.selected
+    if not student_ids:
+        await query.answer("❌ Список пуст. Некого удалять.")
+        return
 
-        await query.message.reply_text(
-            f"Ученик {student_to_remove['LastName']} {student_to_remove['FirstName']} удален.")
+    if student_id in student_ids:
+        del student_ids[student_id]
+        await sessions.set(user_id, session)
+        student = await roster.student(student_id)
+        student_name = f"{student.last_name} {student.first_name}" if student else student_id
+
+        await query.answer(f"Ученик {student_name} удален.")
+        if student_ids:
+            reply_markup = build_remove_keyboard(await get_selected_students(user_id))
+            await query.edit_message_reply_markup(reply_markup=reply_markup)
+        else:
+            await query.edit_message_text("❌ Список пуст.")
     else:
-        await query.message.reply_text("❌ Этот ученик не найден в списке.")
+        await query.answer("❌ Этот ученик не найден в списке.")
+
+
+# Ошибка записи архивной копии только логируется: она не должна подменять ошибку отправки
+# или мешать очистке сессии, а файл при просмотре соберётся из записи списка
+async def store_archive_path(list_id: Optional[int], archive: asyncio.Future):
+    try:
+        file_path = await archive
+        if list_id is not None:
+            await list_store.set_file_path(list_id, file_path)
+    except Exception as e:
+        logger.error(f"Не удалось сохранить архивную копию списка {list_id}: {e}")
 
 
+@router.route("💾 СОХРАНИТЬ И ОТПРАВИТЬ СПИСОК")
 async def generate_excel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
-    if user_id not in user_selected_students or not user_selected_students[user_id]:
+    session = await sessions.get(user_id)
+    if not session.selected:
         await update.message.reply_text("❌ Не выбраны ученики для создания списка.")
         return
 
-    class_name = context.user_data.get("selected_class_name")
-    file_path = create_excel(class_name, user_selected_students[user_id], user_id)
-    with open(file_path, "rb") as file:
-        await update.message.reply_document(document=file)
+    # Класс мог не сохраниться (сессия прежней версии) или исчезнуть после загрузки нового состава
+    class_id = session.class_id
+    class_name = await roster.class_name(class_id) if class_id is not None else None
+    if not class_name:
+        await update.message.reply_text("❌ Класс не выбран. Выберите класс и учеников заново.")
+        return
+
+    today_date = datetime.now(config.TIMEZONE).strftime("%Y-%m-%d")
+    file_name = excel.list_file_name(class_name, today_date)
+    students = await get_selected_students(user_id)
+    data = await excel.render_list_async(students)
 
-    admin_chat_id = 6129878481
-    with open(file_path, "rb") as file:
-        await update.message._bot.send_document(chat_id=admin_chat_id, document=file)
+    # Архивная копия пишется на диск в фоне, параллельно с сохранением записи и отправкой
+    archive = asyncio.ensure_future(excel.save_list_async(user_id, class_name, today_date, data))
+    list_id = None
+    try:
+        list_id = await list_store.add(user_id, class_id, class_name, today_date, students)
+        sent = await update.message.reply_document(document=data, filename=file_name)
+        # Администратору отправляем уже загруженный файл по file_id, без повторной загрузки
+        await update.message._bot.send_document(chat_id=config.ADMIN_CHAT_ID, document=sent.document.file_id)
+        await list_store.set_file_id(list_id, sent.document.file_id)
+    finally:
+        # Путь к копии записываем, даже если отправка не удалась: список уже сохранён
+        await store_archive_path(list_id, archive)
+
+    await sessions.delete(user_id)
+
+
+# Перезагрузка состава классов из базы (только для администратора)
+async def reload_roster(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.message.from_user.id != config.ADMIN_CHAT_ID:
+        return
 
-    user_selected_students[user_id] = []
+    await roster.load()
+    stats = roster.stats()
+    await update.message.reply_text(f"🔄 Состав классов обновлён: {stats['classes']} классов, "
+                                    f"{stats['students']} учеников.\n"
+                                    f"Попаданий в кэш: {stats['hits']}, промахов: {stats['misses']}.")
+
+
+async def download_roster_file(bot, file_id: str) -> io.BytesIO:
+    file = await bot.get_file(file_id)
+    return io.BytesIO(await file.download_as_bytearray())
+
+
+# Администратор присылает CSV или XLSX со списком учеников. Сначала показываем, что изменится,
+# и применяем только после подтверждения кнопкой
+async def import_roster_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.message.from_user.id != config.ADMIN_CHAT_ID:
+        return
+
+    document = update.message.document
+    buffer = await download_roster_file(context.bot, document.file_id)
+    try:
+        diff = await roster_import.import_roster(db, buffer, document.file_name, dry_run=True)
+    except ValueError as e:
+        await update.message.reply_text(f"⚠️ Не удалось загрузить состав классов: {e}")
+        return
+
+    context.user_data["roster_import"] = (document.file_id, document.file_name)
+    keyboard = [[InlineKeyboardButton("✅ Применить", callback_data="roster_apply"),
+                 InlineKeyboardButton("❌ Отмена", callback_data="roster_cancel")]]
+    await update.message.reply_text(f"📥 {document.file_name}: {diff.summary()}.\n"
+                                    f"Удаляются только ученики классов, которые есть в файле.",
+                                    reply_markup=InlineKeyboardMarkup(keyboard))
+
+
+async def confirm_roster_import(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    if query.from_user.id != config.ADMIN_CHAT_ID:
+        return
+
+    pending = context.user_data.pop("roster_import", None)
+    if query.data == "roster_cancel" or pending is None:
+        await query.edit_message_text("❌ Загрузка состава классов отменена.")
+        return
+
+    file_id, file_name = pending
+    buffer = await download_roster_file(context.bot, file_id)
+    try:
+        diff = await roster_import.import_roster(db, buffer, file_name)
+    except ValueError as e:
+        await query.edit_message_text(f"⚠️ Не удалось загрузить состав классов: {e}")
+        return
+
+    await roster.load()
+    await query.edit_message_text(f"✅ Состав классов загружен из {file_name}: {diff.summary()}.")
+
+
+async def send_report(bot, chat_id: int, report_date: str) -> bool:
+    data = await build_daily_report(list_store, report_date)
+    if data is None:
+        return False
+    await bot.send_document(chat_id=chat_id, document=data, filename=f"Отчёт_{report_date}.xlsx")
+    return True
+
+
+# Сводный отчёт по команде: /report или /report ГГГГ-ММ-ДД (только для администратора)
+async def report(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.message.from_user.id != config.ADMIN_CHAT_ID:
+        return
+
+    report_date = context.args[0] if context.args else datetime.now(config.TIMEZONE).strftime("%Y-%m-%d")
+    try:
+        # 2026-10-1 приводится к 2026-10-01, как даты хранятся в базе
+        report_date = datetime.strptime(report_date, "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        await update.message.reply_text("❌ Укажите дату в формате ГГГГ-ММ-ДД.")
+        return
+
+    if not await send_report(context.bot, update.message.chat_id, report_date):
+        await update.message.reply_text(f"❌ За {report_date} списков нет.")
+
+
+# Статистика питания за месяц по классам и по ученикам: /meals или /meals ГГГГ-ММ (только для администратора)
+async def meals(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.message.from_user.id != config.ADMIN_CHAT_ID:
+        return
+
+    month = context.args[0] if context.args else datetime.now(config.TIMEZONE).strftime("%Y-%m")
+    try:
+        # 2026-1 приводится к 2026-01, как месяцы хранятся в базе
+        month = datetime.strptime(month, "%Y-%m").strftime("%Y-%m")
+    except ValueError:
+        await update.message.reply_text("❌ Укажите месяц в формате ГГГГ-ММ.")
+        return
+
+    data = await build_monthly_report(list_store, month)
+    if data is None:
+        await update.message.reply_text(f"❌ За {month} списков нет.")
+        return
+    await update.message.reply_document(document=data, filename=f"Питание_{month}.xlsx")
+
+
+# Ежедневная отправка сводного отчёта администратору
+async def daily_report_job(context: ContextTypes.DEFAULT_TYPE):
+    report_date = datetime.now(config.TIMEZONE).strftime("%Y-%m-%d")
+    if not await send_report(context.bot, config.ADMIN_CHAT_ID, report_date):
+        logger.info(f"Сводный отчёт за {report_date} не отправлен: списков нет")
+
+
+# Ночная очистка устаревших списков всех пользователей
+async def retention_job(context: ContextTypes.DEFAULT_TYPE):
+    await retention.sweep(datetime.now(config.TIMEZONE).date())
+
+
+# Статистика работы бота (только для администратора)
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.message.from_user.id != config.ADMIN_CHAT_ID:
+        return
+
+    text = metrics.render_text() or "Нет данных."
+    await update.message.reply_text(f"📊 Обработчики:\n{text}\n\n"
+                                    f"Состав классов: {roster.stats()}\n"
+                                    f"Сессии: {sessions.stats()}\n"
+                                    f"Исходящая очередь: {outbound_limiter.stats()}\n"
+                                    f"Обработка обновлений: {update_processor.stats()}\n"
+                                    f"Очистка: {retention.stats()}")
+
+
+def metric_gauges() -> dict:
+    gauges = {}
+    for prefix, values in (("bot_roster", roster.stats()), ("bot_sessions", sessions.stats()),
+                           ("bot_outbound", outbound_limiter.stats()),
+                           ("bot_retention", retention.stats()),
+                           ("bot_db", {"connects": db.pool.connects, "reconnects": db.pool.reconnects})):
+        for key, value in values.items():
+            if isinstance(value, (int, float)):
+                gauges[f"{prefix}_{key}"] = value
+    if startup_seconds is not None:
+        gauges["bot_startup_seconds"] = startup_seconds
+    return gauges
 
 
 # Логирование сообщений
 async def log_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_name = update.message.from_user.full_name
-    logger.info(f"Message received from {user_name} (ID: {update.message.from_user.id}): {update.message.text}")
-
-    text = update.message.text
-    if text == "📋 МЕНЮ":
-        await menu(update, context)
-    elif text == "📜 СОЗДАТЬ СПИСОК":
-        await choose_class(update, context)
-    elif text == "ℹ️ИНСТРУКЦИЯ":
-        await info(update, context)
-    elif text == "📄 ПРОСМОТРЕТЬ ТЕКУЩИЙ СПИСОК":
-        await view_current_list(update, context)
-    elif text == "💾 СОХРАНИТЬ И ОТПРАВИТЬ СПИСОК":
-        await generate_excel(update, context)
-    elif text == "✏️ РЕДАКТИРОВАТЬ СПИСОК":
-        await edit_student_list(update, context)
-    elif text == "📂 ПРОШЛЫЕ СПИСКИ":
-        await view_previous_lists(update, context)
-    elif text == "🔙 Назад":
-        await start(update, context)
-
-
-
-async def main():
-    app = ApplicationBuilder().token("7472359286:AAHVC0ibd9FenDWSMoesj7YCydR4VbC_NIA").build()
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("menu", menu))
-    app.add_handler(CommandHandler("info", info))
+    logger.info(f"Message received from {user_name} (ID: {update.message.from_user.id})")
+    logger.debug(f"Текст сообщения: {update.message.text}")
+
+    await router.dispatch(update, context)
+
+
+def add_handlers(app):
+    app.add_handler(CommandHandler("start", metrics.instrumented(start)))
+    app.add_handler(CommandHandler("menu", metrics.instrumented(menu)))
+    app.add_handler(CommandHandler("info", metrics.instrumented(info)))
+    app.add_handler(CommandHandler("reload_roster", metrics.instrumented(reload_roster)))
+    app.add_handler(CommandHandler("report", metrics.instrumented(report)))
+    app.add_handler(CommandHandler("meals", metrics.instrumented(meals)))
+    app.add_handler(CommandHandler("stats", stats))
+    app.add_handler(MessageHandler(filters.Document.FileExtension("csv") | filters.Document.FileExtension("xlsx"),
+                                   metrics.instrumented(import_roster_file)))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, log_messages))
-    app.add_handler(CallbackQueryHandler(send_students_buttons, pattern="^class_"))
-    app.add_handler(CallbackQueryHandler(student_selected, pattern="^student_"))
-    app.add_handler(CallbackQueryHandler(remove_student, pattern="^remove_student_"))
-    app.add_handler(CallbackQueryHandler(handle_edit_menu, pattern="^edit_"))
-    app.add_handler(CallbackQueryHandler(send_selected_file, pattern="^view_file\\|"))
+    app.add_handler(CallbackQueryHandler(metrics.instrumented(send_students_buttons), pattern="^class_"))
+    app.add_handler(CallbackQueryHandler(metrics.instrumented(student_selected), pattern="^student_"))
+    app.add_handler(CallbackQueryHandler(metrics.instrumented(picker_action), pattern="^(page|pick)_"))
+    app.add_handler(CallbackQueryHandler(metrics.instrumented(remove_student), pattern="^remove_student_"))
+    app.add_handler(CallbackQueryHandler(metrics.instrumented(handle_edit_menu), pattern="^edit_"))
+    app.add_handler(CallbackQueryHandler(metrics.instrumented(send_selected_file), pattern="^view_list_"))
+    app.add_handler(CallbackQueryHandler(metrics.instrumented(send_legacy_file), pattern="^view_file\\|"))
+    app.add_handler(CallbackQueryHandler(metrics.instrumented(confirm_roster_import), pattern="^roster_"))
+
+
+def add_jobs(app):
+    if app.job_queue is None:
+        logger.warning("JobQueue недоступна: установите python-telegram-bot[job-queue] для ежедневного отчёта и очистки списков")
+        return
+
+    app.job_queue.run_daily(daily_report_job, config.REPORT_TIME)
+    app.job_queue.run_daily(retention_job, config.RETENTION_TIME)
+    app.job_queue.run_once(retention_job, when=60)
+
 
-    await app.run_polling()
+# Перенос старых списков; ошибка не должна остаться незамеченной в фоновой задаче
+async def migrate_legacy_lists():
+    try:
+        await migrate_user_files(list_store, roster, config.USER_FILES_DIR)
+    except Exception as e:
+        logger.error(f"Ошибка переноса старых списков: {e}")
+
+
+# Прогрев перед приёмом обновлений: состав классов в кэш, openpyxl — в фоне
+async def startup(app):
+    global startup_seconds, migration_task
+
+    excel.preload()
+    roster_started = perf_counter()
+    try:
+        await roster.load()
+    except Exception as e:
+        # Бот всё равно запускается: состав классов загрузится при первом обращении
+        logger.warning(f"Не удалось заранее загрузить состав классов: {e}")
+        roster_seconds = perf_counter() - roster_started
+    else:
+        roster_seconds = perf_counter() - roster_started
+        # Списки, сохранённые до появления хранилища, переносятся в него по составу классов
+        migration_task = asyncio.create_task(migrate_legacy_lists())
+    if config.METRICS_PORT:
+        await metrics.start_http_server(config.METRICS_PORT, gauges=metric_gauges)
+
+    startup_seconds = perf_counter() - IMPORT_STARTED
+    logger.info(f"Холодный старт: {startup_seconds:.2f} с, из них загрузка состава классов {roster_seconds:.2f} с")
+
+
+async def shutdown(app):
+    if migration_task is not None and not migration_task.done():
+        migration_task.cancel()
+        await asyncio.gather(migration_task, return_exceptions=True)
+    await sessions.close()
+    await list_store.close()
+
+
+def build_application():
+    # Ожидающий подтверждения импорт состава (user_data) сохраняется между перезапусками
+    if not config.BOT_TOKEN:
+        raise ValueError("Не задан BOT_TOKEN: укажите его в token.env или в переменной окружения")
+
+    persistence = PicklePersistence(
+        filepath=config.STATE_PATH,
+        store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+    )
+    app = (
+        ApplicationBuilder()
+        .token(config.BOT_TOKEN)
+        .request(metrics.TimedRequest())
+        .rate_limiter(outbound_limiter)
+        .concurrent_updates(update_processor)
+        .persistence(persistence)
+        .post_init(startup)
+        .post_shutdown(shutdown)
+        .build()
+    )
+    add_handlers(app)
+    add_jobs(app)
+    return app
+
+
+def main():
+    if config.BOT_MODE == "webhook" and not config.WEBHOOK_URL:
+        raise ValueError("Для режима webhook задайте WEBHOOK_URL — публичный HTTPS-адрес бота")
+
+    app = build_application()
+
+    if config.BOT_MODE == "webhook":
+        app.run_webhook(
+            listen=config.WEBHOOK_LISTEN,
+            port=config.WEBHOOK_PORT,
+            url_path=config.WEBHOOK_PATH,
+            webhook_url=config.WEBHOOK_URL,
+            secret_token=config.WEBHOOK_SECRET,
+        )
+    elif config.BOT_MODE == "polling":
+        app.run_polling()
+    else:
+        raise ValueError(f"Неизвестный режим BOT_MODE: {config.BOT_MODE!r}")
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
\ No newline at end of file
+    main()
\ No newline at end of file
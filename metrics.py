@@ -0,0 +1,174 @@
+import asyncio
+import bisect
+import contextvars
+import functools
+import logging
+import time
+from typing import Optional
+
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм, мс
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value_ms: float):
+        self.counts[bisect.bisect_left(BUCKETS, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else float("inf")
+        return float("inf")
+
+    @property
+    def avg(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class HandlerMetrics:
+    def __init__(self):
+        self.latency = Histogram()
+        self.db = Histogram()
+        self.api = Histogram()
+        self.errors = 0
+
+
+# Время, накопленное текущим обработчиком в базе данных и в запросах к Telegram
+_current: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("handler_timings", default=None)
+
+handlers: dict[str, HandlerMetrics] = {}
+
+
+def record_db_time(seconds: float):
+    timings = _current.get()
+    if timings is not None:
+        timings["db"] += seconds
+
+
+def record_api_time(seconds: float):
+    timings = _current.get()
+    if timings is not None:
+        timings["api"] += seconds
+
+
+# Обёртка обработчика: задержка, время в БД и в Telegram API, количество ошибок
+def instrumented(callback, name: str = None):
+    name = name or callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        if _current.get() is not None:
+            # Уже внутри измеряемого обработчика
+            return await callback(update, context)
+
+        timings = {"db": 0.0, "api": 0.0}
+        token = _current.set(timings)
+        started = time.perf_counter()
+        stats = handlers.setdefault(name, HandlerMetrics())
+        try:
+            return await callback(update, context)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            _current.reset(token)
+            stats.latency.observe((time.perf_counter() - started) * 1000)
+            stats.db.observe(timings["db"] * 1000)
+            stats.api.observe(timings["api"] * 1000)
+
+    return wrapper
+
+
+# Запросы к Telegram с замером времени
+class TimedRequest(HTTPXRequest):
+    async def do_request(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().do_request(*args, **kwargs)
+        finally:
+            record_api_time(time.perf_counter() - started)
+
+
+def _fmt(value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    return "∞" if value == float("inf") else f"{value:.0f}"
+
+
+def render_text() -> str:
+    lines = []
+    for name in sorted(handlers):
+        stats = handlers[name]
+        lines.append(
+            f"{name}: {stats.latency.count} выз., p50≤{_fmt(stats.latency.quantile(0.5))} мс, "
+            f"p99≤{_fmt(stats.latency.quantile(0.99))} мс, БД {stats.db.avg:.0f} мс, "
+            f"API {stats.api.avg:.0f} мс, ошибок {stats.errors}"
+        )
+    return "\n".join(lines)
+
+
+def _prometheus_histogram(lines: list, metric: str, name: str, histogram: Histogram):
+    seen = 0
+    for bound, count in zip(BUCKETS, histogram.counts):
+        seen += count
+        lines.append(f'{metric}_bucket{{handler="{name}",le="{bound / 1000}"}} {seen}')
+    lines.append(f'{metric}_bucket{{handler="{name}",le="+Inf"}} {histogram.count}')
+    lines.append(f'{metric}_sum{{handler="{name}"}} {histogram.total / 1000}')
+    lines.append(f'{metric}_count{{handler="{name}"}} {histogram.count}')
+
+
+def render_prometheus(gauges: dict = None) -> str:
+    lines = []
+    for metric, attr in (("bot_handler_seconds", "latency"), ("bot_handler_db_seconds", "db"),
+                         ("bot_handler_api_seconds", "api")):
+        lines.append(f"# TYPE {metric} histogram")
+        for name in sorted(handlers):
+            _prometheus_histogram(lines, metric, name, getattr(handlers[name], attr))
+    lines.append("# TYPE bot_handler_errors_total counter")
+    for name in sorted(handlers):
+        lines.append(f'bot_handler_errors_total{{handler="{name}"}} {handlers[name].errors}')
+    for name, value in (gauges or {}).items():
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# Необязательная точка /metrics в текстовом формате Prometheus
+async def start_http_server(port: int, gauges=None, host: str = "127.0.0.1") -> asyncio.AbstractServer:
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            if request_line.split(b" ")[1:2] == [b"/metrics"]:
+                body = render_prometheus(gauges() if gauges else None).encode()
+                status = "200 OK"
+            else:
+                body, status = b"not found\n", "404 Not Found"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Optional
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Методы, которые отправляются вне очереди
+PRIORITY_ENDPOINTS = {"sendDocument"}
+# Повторные правки одного и того же сообщения: в очереди достаточно оставить последнюю
+COALESCED_ENDPOINTS = {"editMessageReplyMarkup", "editMessageText"}
+# Ответы на нажатия кнопок не привязаны к чату и должны уходить сразу
+CHAT_EXEMPT_ENDPOINTS = {"answerCallbackQuery"}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    # Через сколько секунд появится свободный токен
+    def delay(self, now: float) -> float:
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+# Очередь исходящих запросов к Telegram: общий лимит и лимит на чат (token bucket),
+# документы вне очереди, склейка повторных правок одного сообщения и пауза при flood wait.
+class OutboundLimiter(BaseRateLimiter[int]):
+    def __init__(self, overall_rate: float = 30, chat_rate: float = 1, chat_burst: float = 3,
+                 group_rate: float = 20 / 60, max_retries: int = 3):
+        self.overall = TokenBucket(overall_rate, overall_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._chats: dict[int, TokenBucket] = {}
+        self._paused_until = 0.0
+        self._priority_ready = 0
+        self._latest_edit: dict[tuple, int] = {}
+        self._edit_counter = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.flood_waits = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 1000:
+                now = time.monotonic()
+                self._chats = {key: b for key, b in self._chats.items() if not b.idle(now)}
+            # Отрицательные chat_id — группы, у них лимит строже
+            bucket = TokenBucket(self.group_rate, 1) if chat_id < 0 else TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    # Ждёт свободного токена; False — запрос стал не нужен, пока ждал.
+    # Приоритет действует только на общий лимит: документ, который ждёт лимита своего чата,
+    # не задерживает запросы в другие чаты.
+    async def _acquire(self, chat_id: Optional[int], priority: bool, superseded=None) -> bool:
+        ready = False
+        try:
+            while True:
+                if superseded is not None and superseded():
+                    return False
+                chat = self._chat_bucket(chat_id) if chat_id is not None else None
+                now = time.monotonic()
+                delay = max(self._paused_until - now, chat.delay(now) if chat else 0.0)
+                if priority and (delay <= 0) != ready:
+                    ready = delay <= 0
+                    self._priority_ready += 1 if ready else -1
+                if not priority and self._priority_ready:
+                    delay = max(delay, 0.01)
+                delay = max(delay, self.overall.delay(now))
+                if delay <= 0:
+                    self.overall.take()
+                    if chat:
+                        chat.take()
+                    return True
+                await asyncio.sleep(delay)
+        finally:
+            if ready:
+                self._priority_ready -= 1
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        try:
+            chat_id = int(data.get("chat_id"))
+        except (TypeError, ValueError):
+            # Нет чата (answerCallbackQuery) или чат указан как @username
+            chat_id = None
+        if endpoint in CHAT_EXEMPT_ENDPOINTS:
+            chat_id = None
+        priority = endpoint in PRIORITY_ENDPOINTS
+
+        superseded = None
+        if endpoint in COALESCED_ENDPOINTS:
+            edit_key = (data.get("chat_id"), data.get("message_id"), data.get("inline_message_id"))
+            self._edit_counter += 1
+            edit_number = self._edit_counter
+            self._latest_edit[edit_key] = edit_number
+
+            def superseded():
+                return self._latest_edit.get(edit_key) != edit_number
+
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        try:
+            acquired = await self._acquire(chat_id, priority, superseded)
+        finally:
+            self.queued -= 1
+
+        if not acquired:
+            # Пока запрос ждал очереди, пришла более свежая правка того же сообщения
+            self.coalesced += 1
+            return True
+        if superseded is not None:
+            del self._latest_edit[edit_key]
+
+        max_retries = rate_limit_args if rate_limit_args is not None else self.max_retries
+        for attempt in range(max_retries + 1):
+            try:
+                result = await callback(*args, **kwargs)
+                self.sent += 1
+                return result
+            except RetryAfter as e:
+                if attempt == max_retries:
+                    raise
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                delay = retry_after + 0.1 * (attempt + 1)
+                self.flood_waits += 1
+                # Ограничение Telegram действует на весь бот — останавливаем всю очередь
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                logger.warning(f"Flood wait для {endpoint}: повтор через {delay:.1f} с")
+                await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "flood_waits": self.flood_waits,
+        }
@@ -0,0 +1,26 @@
+from datetime import date
+from typing import Optional
+
+import excel
+from saved_lists import ListStore
+
+
+# Сводный отчёт для столовой за день. Для каждого класса берётся последний отправленный список,
+# данные читаются из хранилища списков, без повторного чтения xlsx-файлов.
+async def build_daily_report(store: ListStore, report_date: str) -> Optional[bytes]:
+    entries = await store.latest_per_class(report_date)
+    if not entries:
+        return None
+    return await excel.render_report_async(report_date, entries)
+
+
+# Статистика питания за месяц (ГГГГ-ММ) по журналу: агрегаты считаются запросами к базе
+async def build_monthly_report(store: ListStore, month: str) -> Optional[bytes]:
+    first_day = date.fromisoformat(f"{month}-01")
+    next_month = date(first_day.year + first_day.month // 12, first_day.month % 12 + 1, 1)
+    date_from, date_to = first_day.isoformat(), next_month.isoformat()
+    classes = await store.class_meals(date_from, date_to)
+    if not classes:
+        return None
+    students = await store.student_meals(date_from, date_to)
+    return await excel.render_meal_stats_async(month, classes, students)
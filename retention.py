@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import date, timedelta
+from typing import Optional
+
+from legacy_lists import FILE_NAME
+from saved_lists import ListStore
+
+logger = logging.getLogger(__name__)
+
+
+# Удаление устаревших списков всех пользователей за один проход.
+# Какие списки устарели, определяется по дате в хранилище, а не по именам файлов.
+# Журнал питания meal_log не затрагивается — по нему считается статистика за прошлые месяцы.
+# Если задана папка files_dir, из неё удаляются и файлы старше срока хранения, на которые
+# не ссылается ни один список, — только списки вида <ID пользователя>/<класс>_<ГГГГ-ММ-ДД>.xlsx.
+# Остальное (например, база SQLite, если она лежит в той же папке) не трогается.
+class RetentionSweeper:
+    def __init__(self, store: ListStore, retention_days: int = 7, files_dir: Optional[str] = None):
+        self.store = store
+        self.retention_days = retention_days
+        self.files_dir = files_dir
+        self.runs = 0
+        self.lists_deleted = 0
+        self.files_deleted = 0
+        self.bytes_reclaimed = 0
+
+    @staticmethod
+    def _orphan_files(files_dir: str, known: set[str], before: float) -> list[str]:
+        orphans = []
+        if not os.path.isdir(files_dir):
+            return orphans
+        for user_folder in os.listdir(files_dir):
+            folder = os.path.join(files_dir, user_folder)
+            if not user_folder.isdigit() or not os.path.isdir(folder):
+                continue
+            for file_name in os.listdir(folder):
+                path = os.path.normpath(os.path.join(folder, file_name))
+                if not FILE_NAME.match(file_name) or not os.path.isfile(path):
+                    continue
+                try:
+                    if path not in known and os.path.getmtime(path) < before:
+                        orphans.append(path)
+                except FileNotFoundError:
+                    continue
+        return orphans
+
+    def _remove_files(self, paths: list[str]) -> tuple[int, int]:
+        files, size = 0, 0
+        for path in paths:
+            try:
+                file_size = os.path.getsize(path)
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            files += 1
+            size += file_size
+            folder = os.path.dirname(path)
+            if folder and not os.listdir(folder) and not self._is_files_dir(folder):
+                os.rmdir(folder)
+        return files, size
+
+    async def sweep(self, today: date = None) -> dict:
+        today = today or date.today()
+        cutoff = (today - timedelta(days=self.retention_days)).isoformat()
+        expired = await self.store.expired(cutoff)
+
+        files, size = 0, 0
+        if expired:
+            files, size = await asyncio.to_thread(self._remove_files, [path for _, path in expired if path])
+            await self.store.delete([list_id for list_id, _ in expired])
+
+        if self.files_dir:
+            known = {os.path.normpath(path) for path in await self.store.file_paths()}
+            before = time.time() - self.retention_days * 24 * 60 * 60
+            orphans = await asyncio.to_thread(self._orphan_files, self.files_dir, known, before)
+            orphan_files, orphan_size = await asyncio.to_thread(self._remove_files, orphans)
+            files += orphan_files
+            size += orphan_size
+
+        self.runs += 1
+        self.lists_deleted += len(expired)
+        self.files_deleted += files
+        self.bytes_reclaimed += size
+        logger.info(f"Очистка списков старше {cutoff}: удалено списков {len(expired)}, "
+                    f"файлов {files}, освобождено {size} байт")
+        return {"lists": len(expired), "files": files, "bytes": size}
+
+    def _is_files_dir(self, folder: str) -> bool:
+        return self.files_dir is not None and os.path.abspath(folder) == os.path.abspath(self.files_dir)
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "lists_deleted": self.lists_deleted,
+            "files_deleted": self.files_deleted,
+            "bytes_reclaimed": self.bytes_reclaimed,
+        }
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import time
+from typing import NamedTuple, Optional
+
+import db as repo
+from db import ClassRow, StudentRow
+
+logger = logging.getLogger(__name__)
+
+
+# Неизменяемый снимок списка классов и учеников
+class RosterSnapshot(NamedTuple):
+    classes: tuple[ClassRow, ...]
+    by_id: dict[int, ClassRow]
+    by_name: dict[str, ClassRow]
+    students: dict[int, tuple[StudentRow, ...]]
+    students_by_id: dict[int, StudentRow]
+
+
+def build_snapshot(classes: list[ClassRow], students: list[tuple[int, StudentRow]]) -> RosterSnapshot:
+    grouped: dict[int, list[StudentRow]] = {c.class_id: [] for c in classes}
+    by_id: dict[int, StudentRow] = {}
+    for class_id, student in students:
+        grouped.setdefault(class_id, []).append(student)
+        by_id[student.student_id] = student
+    return RosterSnapshot(
+        classes=tuple(classes),
+        by_id={c.class_id: c for c in classes},
+        by_name={c.class_name: c for c in classes},
+        students={class_id: tuple(s) for class_id, s in grouped.items()},
+        students_by_id=by_id,
+    )
+
+
+# Кэш состава классов. Загружается при старте и обновляется в фоне по истечении TTL,
+# поэтому построение клавиатур не обращается к базе данных.
+class RosterCache:
+    def __init__(self, db: repo.Database, ttl: float = 6 * 60 * 60):
+        self.db = db
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.loaded_at: Optional[float] = None
+        self._snapshot: Optional[RosterSnapshot] = None
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    # Вызывается под self._lock
+    async def _fetch(self) -> RosterSnapshot:
+        classes = await repo.get_classes(self.db)
+        students = await repo.get_all_students(self.db)
+        self._snapshot = build_snapshot(classes, students)
+        self.loaded_at = time.monotonic()
+        logger.info(f"Состав классов загружен: {len(classes)} классов, {len(students)} учеников")
+        return self._snapshot
+
+    async def load(self) -> RosterSnapshot:
+        async with self._lock:
+            return await self._fetch()
+
+    def _is_fresh(self) -> bool:
+        return self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl
+
+    async def snapshot(self) -> RosterSnapshot:
+        if self._snapshot is not None and self._is_fresh():
+            self.hits += 1
+            return self._snapshot
+
+        self.misses += 1
+        if self._snapshot is None:
+            async with self._lock:
+                # Пока ждали блокировку, снимок мог загрузить другой обработчик
+                if self._snapshot is None:
+                    return await self._fetch()
+            return self._snapshot
+
+        # Устаревший снимок отдаём сразу, а свежий загружаем в фоне
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self.load())
+        return self._snapshot
+
+    async def classes(self) -> tuple[ClassRow, ...]:
+        return (await self.snapshot()).classes
+
+    async def class_name(self, class_id: int) -> Optional[str]:
+        row = (await self.snapshot()).by_id.get(class_id)
+        return row.class_name if row else None
+
+    async def class_id(self, class_name: str) -> Optional[int]:
+        row = (await self.snapshot()).by_name.get(class_name)
+        return row.class_id if row else None
+
+    async def students(self, class_id: int) -> tuple[StudentRow, ...]:
+        return (await self.snapshot()).students.get(class_id, ())
+
+    async def student(self, student_id: int) -> Optional[StudentRow]:
+        return (await self.snapshot()).students_by_id.get(student_id)
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "classes": len(snapshot.classes) if snapshot else 0,
+            "students": len(snapshot.students_by_id) if snapshot else 0,
+            "age": round(time.monotonic() - self.loaded_at) if self.loaded_at is not None else None,
+        }
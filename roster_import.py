@@ -0,0 +1,228 @@
+import argparse
+import asyncio
+import csv
+import io
+import logging
+import os
+from typing import Iterator, NamedTuple, Optional
+
+import config
+import db as repo
+
+logger = logging.getLogger(__name__)
+
+# Размер пачки для executemany
+BATCH_SIZE = 500
+
+# Допустимые названия столбцов в файле со списком учеников
+COLUMN_ALIASES = {
+    "class_name": {"класс", "classname", "class"},
+    "last_name": {"фамилия", "lastname", "last_name"},
+    "first_name": {"имя", "firstname", "first_name"},
+    "student_id": {"studentid", "student_id", "id"},
+}
+REQUIRED_COLUMNS = {"class_name": "Класс", "last_name": "Фамилия", "first_name": "Имя"}
+
+
+class ImportRow(NamedTuple):
+    class_name: str
+    last_name: str
+    first_name: str
+    student_id: Optional[int]
+
+
+class RosterDiff(NamedTuple):
+    new_classes: list[str]
+    inserts: list[ImportRow]
+    updates: list[tuple[int, ImportRow]]
+    deletes: list[int]
+    unchanged: int
+
+    def summary(self) -> str:
+        return (f"новых классов: {len(self.new_classes)}, добавлено учеников: {len(self.inserts)}, "
+                f"изменено: {len(self.updates)}, удалено: {len(self.deletes)}, без изменений: {self.unchanged}")
+
+
+def _columns(header) -> dict[str, int]:
+    columns = {}
+    for index, title in enumerate(header):
+        title = str(title or "").strip().lower().replace(" ", "")
+        for column, aliases in COLUMN_ALIASES.items():
+            if title in aliases:
+                columns[column] = index
+    missing = [title for column, title in REQUIRED_COLUMNS.items() if column not in columns]
+    if missing:
+        raise ValueError(f"в файле нет столбцов: {', '.join(missing)}")
+    return columns
+
+
+def _rows(records) -> Iterator[ImportRow]:
+    columns = None
+    for line, record in enumerate(records, start=1):
+        if columns is None:
+            columns = _columns(record)
+            width = max(columns.values()) + 1
+            continue
+        values = [str(v).strip() if v is not None else "" for v in record]
+        values += [""] * (width - len(values))
+        if not any(values):
+            continue
+        # Строку с пустым классом, фамилией или именем не пропускаем молча: файл отклоняется целиком
+        empty = [title for column, title in REQUIRED_COLUMNS.items() if not values[columns[column]]]
+        if empty:
+            raise ValueError(f"строка {line}: не заполнено {', '.join(empty)}")
+        student_id = values[columns["student_id"]] if "student_id" in columns else ""
+        try:
+            student_id = int(float(student_id)) if student_id else None
+        except ValueError:
+            raise ValueError(f"строка {line}: StudentID должен быть числом") from None
+        yield ImportRow(
+            class_name=values[columns["class_name"]],
+            last_name=values[columns["last_name"]],
+            first_name=values[columns["first_name"]],
+            student_id=student_id,
+        )
+    if columns is None:
+        raise ValueError("файл пустой")
+
+
+# Построчное чтение CSV или XLSX без загрузки всего файла в память
+def read_roster(file, file_name: str) -> Iterator[ImportRow]:
+    if file_name.lower().endswith(".xlsx"):
+        import openpyxl
+
+        wb = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        try:
+            yield from _rows(wb.active.iter_rows(values_only=True))
+        finally:
+            wb.close()
+        return
+
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        # Разделитель не определился (например, пустой файл) — отсутствие столбцов покажет проверка заголовка
+        dialect = csv.excel
+    try:
+        yield from _rows(csv.reader(text, dialect))
+    except csv.Error as e:
+        raise ValueError(f"ошибка в CSV: {e}") from None
+
+
+# Удаляются только ученики классов, которые есть в файле: файл с одним классом не трогает остальные.
+# full_sync=True — файл содержит всю школу, и все, кого в нём нет, удаляются.
+def diff_roster(classes: list[repo.ClassRow], students: list[tuple[int, repo.StudentRow]], rows,
+                full_sync: bool = False) -> RosterDiff:
+    rows = list(rows)
+    if not rows:
+        raise ValueError("в файле нет учеников")
+    file_classes = {row.class_name for row in rows}
+    class_names = {c.class_id: c.class_name for c in classes}
+    current = {s.student_id: ImportRow(class_names.get(class_id, ""), s.last_name, s.first_name, s.student_id)
+               for class_id, s in students}
+    by_key = {(r.class_name, r.last_name, r.first_name): student_id for student_id, r in current.items()}
+
+    new_classes = []
+    seen_classes = set(class_names.values())
+    inserts, updates, unmatched, matched = [], [], [], set()
+    for row in rows:
+        if row.class_name not in seen_classes:
+            seen_classes.add(row.class_name)
+            new_classes.append(row.class_name)
+
+        student_id = row.student_id if row.student_id in current else by_key.get(
+            (row.class_name, row.last_name, row.first_name))
+        if student_id is None or student_id in matched:
+            unmatched.append(row)
+            continue
+        matched.add(student_id)
+        old = current[student_id]
+        if (old.class_name, old.last_name, old.first_name) != (row.class_name, row.last_name, row.first_name):
+            updates.append((student_id, row))
+
+    # Ученик перешёл в другой класс: однозначное совпадение по фамилии и имени — это изменение, а не удаление
+    left = {}
+    for student_id, old in current.items():
+        if student_id not in matched:
+            left.setdefault((old.last_name, old.first_name), []).append(student_id)
+    for row in unmatched:
+        candidates = left.get((row.last_name, row.first_name), [])
+        if len(candidates) == 1:
+            student_id = candidates.pop()
+            matched.add(student_id)
+            updates.append((student_id, row))
+        else:
+            inserts.append(row)
+
+    deletes = [student_id for student_id, old in current.items()
+               if student_id not in matched and (full_sync or old.class_name in file_classes)]
+    unchanged = len(matched) - len(updates)
+    return RosterDiff(new_classes, inserts, updates, deletes, unchanged)
+
+
+def _batches(items: list, size: int = BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _apply(conn, diff: RosterDiff):
+    cursor = conn.cursor()
+    if hasattr(cursor, "fast_executemany"):
+        # pyodbc: отправлять пачку одним запросом к SQL Server
+        cursor.fast_executemany = True
+
+    for batch in _batches([(name,) for name in diff.new_classes]):
+        cursor.executemany("INSERT INTO Classes (ClassName) VALUES (?)", batch)
+    cursor.execute("SELECT ClassID, ClassName FROM Classes")
+    class_ids = {row[1]: row[0] for row in cursor.fetchall()}
+
+    for batch in _batches([(class_ids[r.class_name], r.last_name, r.first_name, student_id)
+                           for student_id, r in diff.updates]):
+        cursor.executemany("UPDATE Students SET ClassID=?, LastName=?, FirstName=? WHERE StudentID=?", batch)
+    for batch in _batches([(r.last_name, r.first_name, class_ids[r.class_name]) for r in diff.inserts]):
+        cursor.executemany("INSERT INTO Students (LastName, FirstName, ClassID) VALUES (?, ?, ?)", batch)
+    for batch in _batches([(student_id,) for student_id in diff.deletes]):
+        cursor.executemany("DELETE FROM Students WHERE StudentID=?", batch)
+    cursor.close()
+
+
+# Сравнивает файл с текущим составом и применяет изменения одной транзакцией
+async def import_roster(db: repo.Database, file, file_name: str, dry_run: bool = False,
+                        full_sync: bool = False) -> RosterDiff:
+    classes = await repo.get_classes(db)
+    students = await repo.get_all_students(db)
+    rows = await asyncio.to_thread(lambda: list(read_roster(file, file_name)))
+    diff = diff_roster(classes, students, rows, full_sync=full_sync)
+    logger.info(f"Импорт состава классов из {file_name}: {diff.summary()}")
+    if not dry_run:
+        await db.transaction(lambda conn: _apply(conn, diff))
+    return diff
+
+
+async def _cli(args):
+    if args.sqlite:
+        db = repo.SqliteDatabase(args.sqlite)
+    else:
+        db = repo.sql_server_database(args.connection)
+    try:
+        with open(args.file, "rb") as file:
+            diff = await import_roster(db, file, os.path.basename(args.file), dry_run=args.dry_run,
+                                       full_sync=args.full_sync)
+    finally:
+        db.close()
+    print(("Проверка без изменений: " if args.dry_run else "Импорт выполнен: ") + diff.summary())
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Загрузка состава классов из CSV или XLSX")
+    parser.add_argument("file", help="файл со столбцами Класс, Фамилия, Имя (и необязательно StudentID)")
+    parser.add_argument("--dry-run", action="store_true", help="только показать изменения")
+    parser.add_argument("--full-sync", action="store_true",
+                        help="файл содержит всю школу: удалить учеников классов, которых нет в файле")
+    parser.add_argument("--connection", default=config.DB_CONNECTION_STRING, help="строка подключения ODBC")
+    parser.add_argument("--sqlite", help="путь к базе SQLite вместо SQL Server")
+    asyncio.run(_cli(parser.parse_args()))
@@ -0,0 +1,32 @@
+import logging
+
+from metrics import instrumented
+
+logger = logging.getLogger(__name__)
+
+
+# Таблица маршрутов: текст кнопки -> обработчик. Клавиатуры регистрируют свои кнопки
+# декоратором route, а входящий текст ищется в словаре вместо цепочки if/elif.
+class Router:
+    def __init__(self):
+        self.routes = {}
+
+    def register(self, label: str, handler):
+        if label in self.routes:
+            raise ValueError(f"Кнопка {label!r} уже зарегистрирована")
+        self.routes[label] = instrumented(handler)
+
+    def route(self, *labels: str):
+        def decorator(handler):
+            for label in labels:
+                self.register(label, handler)
+            return handler
+
+        return decorator
+
+    async def dispatch(self, update, context) -> bool:
+        handler = self.routes.get(update.message.text)
+        if handler is None:
+            return False
+        await handler(update, context)
+        return True
@@ -0,0 +1,278 @@
+import asyncio
+import json
+import sqlite3
+import time
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from db import StudentRow
+from metrics import record_db_time
+
+
+class ListRecord(NamedTuple):
+    list_id: int
+    user_id: int
+    class_id: Optional[int]
+    class_name: str
+    list_date: str
+    students: tuple[StudentRow, ...]
+    created_at: str
+    file_id: Optional[str]
+    file_path: Optional[str]
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lists (
+    list_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    class_id INTEGER,
+    class_name TEXT NOT NULL,
+    list_date TEXT NOT NULL,
+    students TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    file_id TEXT,
+    file_path TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_lists_user ON lists(user_id, list_date);
+CREATE INDEX IF NOT EXISTS ix_lists_date_class ON lists(list_date, class_name, list_id);
+CREATE TABLE IF NOT EXISTS meal_log (
+    list_id INTEGER NOT NULL,
+    list_date TEXT NOT NULL,
+    class_name TEXT NOT NULL,
+    student_id INTEGER NOT NULL,
+    last_name TEXT NOT NULL,
+    first_name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_meal_log_date_class ON meal_log(list_date, class_name, list_id);
+CREATE TABLE IF NOT EXISTS legacy_skipped (
+    file_path TEXT PRIMARY KEY,
+    reason TEXT NOT NULL
+);
+"""
+
+COLUMNS = "list_id, user_id, class_id, class_name, list_date, students, created_at, file_id, file_path"
+
+# Строки журнала питания, попавшие в последний список своего класса за день
+LATEST_MEALS = """
+SELECT * FROM meal_log WHERE list_date>=? AND list_date<? AND list_id IN (
+    SELECT MAX(list_id) FROM meal_log WHERE list_date>=? AND list_date<? GROUP BY list_date, class_name
+)
+"""
+
+
+class ClassMeals(NamedTuple):
+    class_name: str
+    days: int
+    meals: int
+
+
+class StudentMeals(NamedTuple):
+    class_name: str
+    student_id: int
+    last_name: str
+    first_name: str
+    meals: int
+
+
+def _record(row) -> ListRecord:
+    students = tuple(StudentRow(*s) for s in json.loads(row[5]))
+    return ListRecord(row[0], row[1], row[2], row[3], row[4], students, row[6], row[7], row[8])
+
+
+# Сохранённые списки в виде структурированных записей с индексами по пользователю и по дате/классу.
+# xlsx собирается из записи по требованию, а file_id и путь к архивной копии служат кэшем.
+# Каждый список дополнительно пишется в журнал питания meal_log: он только пополняется
+# и не чистится вместе со списками, по нему считается статистика за месяц.
+class ListStore:
+    def __init__(self, path: str = "lists.sqlite3"):
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = asyncio.Lock()
+
+    # Файл открывается при первом обращении, чтобы импорт модулей бота ничего не создавал на диске
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.executescript(SCHEMA)
+            self._connection.commit()
+            self._backfill_meal_log()
+        return self._connection
+
+    # Журнал появился позже списков: при первом запуске переносим в него уже сохранённые списки
+    def _backfill_meal_log(self):
+        if self._conn.execute("SELECT 1 FROM meal_log LIMIT 1").fetchone():
+            return
+        rows = self._conn.execute(f"SELECT {COLUMNS} FROM lists").fetchall()
+        with self._conn:
+            for row in rows:
+                self._log_meals(_record(row))
+
+    def _log_meals(self, record: ListRecord):
+        self._conn.executemany(
+            "INSERT INTO meal_log (list_id, list_date, class_name, student_id, last_name, first_name) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(record.list_id, record.list_date, record.class_name, s.student_id, s.last_name, s.first_name)
+             for s in record.students],
+        )
+
+    async def _run(self, fn, *args):
+        started = time.perf_counter()
+        try:
+            async with self._lock:
+                return await asyncio.to_thread(fn, *args)
+        finally:
+            record_db_time(time.perf_counter() - started)
+
+    def _add(self, user_id, class_id, class_name, list_date, students) -> int:
+        payload = json.dumps([list(s) for s in students], ensure_ascii=False)
+        created_at = datetime.now().isoformat(timespec="seconds")
+        with self._conn:
+            # Новый список пользователя для класса за ту же дату заменяет прежний
+            self._conn.execute(
+                "DELETE FROM lists WHERE user_id=? AND list_date=? AND class_name=?",
+                (user_id, list_date, class_name),
+            )
+            cursor = self._conn.execute(
+                "INSERT INTO lists (user_id, class_id, class_name, list_date, students, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, class_id, class_name, list_date, payload, created_at),
+            )
+            self._log_meals(ListRecord(cursor.lastrowid, user_id, class_id, class_name, list_date,
+                                       tuple(students), created_at, None, None))
+        return cursor.lastrowid
+
+    async def add(self, user_id: int, class_id: Optional[int], class_name: str, list_date: str, students) -> int:
+        return await self._run(self._add, user_id, class_id, class_name, list_date, list(students))
+
+    # Перенос списка, сохранённого до появления хранилища: время и путь к файлу берутся из старого xlsx
+    def _import(self, user_id, class_id, class_name, list_date, students, created_at, file_path) -> int:
+        payload = json.dumps([list(s) for s in students], ensure_ascii=False)
+        with self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO lists (user_id, class_id, class_name, list_date, students, created_at, file_path) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, class_id, class_name, list_date, payload, created_at, file_path),
+            )
+            self._log_meals(ListRecord(cursor.lastrowid, user_id, class_id, class_name, list_date,
+                                       tuple(students), created_at, None, file_path))
+        return cursor.lastrowid
+
+    async def import_list(self, user_id: int, class_id: Optional[int], class_name: str, list_date: str, students,
+                          created_at: str, file_path: str) -> int:
+        return await self._run(self._import, user_id, class_id, class_name, list_date, list(students),
+                               created_at, file_path)
+
+    def _file_paths(self) -> set[str]:
+        return {row[0] for row in self._conn.execute("SELECT file_path FROM lists WHERE file_path IS NOT NULL")}
+
+    async def file_paths(self) -> set[str]:
+        return await self._run(self._file_paths)
+
+    # Старые файлы, которые не удалось перенести: при следующих запусках их не читаем повторно
+    def _skipped_files(self) -> set[str]:
+        return {row[0] for row in self._conn.execute("SELECT file_path FROM legacy_skipped")}
+
+    async def skipped_files(self) -> set[str]:
+        return await self._run(self._skipped_files)
+
+    def _skip_file(self, file_path: str, reason: str):
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO legacy_skipped (file_path, reason) VALUES (?, ?)",
+                               (file_path, reason))
+
+    async def skip_file(self, file_path: str, reason: str):
+        await self._run(self._skip_file, file_path, reason)
+
+    def _find_by_path(self, user_id: int, file_path: str) -> Optional[ListRecord]:
+        row = self._conn.execute(
+            f"SELECT {COLUMNS} FROM lists WHERE user_id=? AND file_path=? ORDER BY list_id DESC",
+            (user_id, file_path),
+        ).fetchone()
+        return _record(row) if row else None
+
+    async def find_by_path(self, user_id: int, file_path: str) -> Optional[ListRecord]:
+        return await self._run(self._find_by_path, user_id, file_path)
+
+    def _get(self, list_id: int) -> Optional[ListRecord]:
+        row = self._conn.execute(f"SELECT {COLUMNS} FROM lists WHERE list_id=?", (list_id,)).fetchone()
+        return _record(row) if row else None
+
+    async def get(self, list_id: int) -> Optional[ListRecord]:
+        return await self._run(self._get, list_id)
+
+    def _user_lists(self, user_id: int) -> list[ListRecord]:
+        rows = self._conn.execute(
+            f"SELECT {COLUMNS} FROM lists WHERE user_id=? ORDER BY list_date DESC, list_id DESC", (user_id,)
+        ).fetchall()
+        return [_record(row) for row in rows]
+
+    async def user_lists(self, user_id: int) -> list[ListRecord]:
+        return await self._run(self._user_lists, user_id)
+
+    # Последний список каждого класса за дату, кто бы из учителей его ни отправил
+    def _latest_per_class(self, list_date: str) -> list[ListRecord]:
+        rows = self._conn.execute(
+            f"SELECT {COLUMNS} FROM lists WHERE list_id IN ("
+            "SELECT MAX(list_id) FROM lists WHERE list_date=? GROUP BY class_name"
+            ") ORDER BY class_name",
+            (list_date,),
+        ).fetchall()
+        return [_record(row) for row in rows]
+
+    async def latest_per_class(self, list_date: str) -> list[ListRecord]:
+        return await self._run(self._latest_per_class, list_date)
+
+    def _update(self, list_id: int, column: str, value):
+        with self._conn:
+            self._conn.execute(f"UPDATE lists SET {column}=? WHERE list_id=?", (value, list_id))
+
+    async def set_file_id(self, list_id: int, file_id: str):
+        await self._run(self._update, list_id, "file_id", file_id)
+
+    async def set_file_path(self, list_id: int, file_path: str):
+        await self._run(self._update, list_id, "file_path", file_path)
+
+    def _expired(self, before_date: str) -> list[tuple[int, Optional[str]]]:
+        return self._conn.execute(
+            "SELECT list_id, file_path FROM lists WHERE list_date<?", (before_date,)
+        ).fetchall()
+
+    async def expired(self, before_date: str) -> list[tuple[int, Optional[str]]]:
+        return await self._run(self._expired, before_date)
+
+    def _delete(self, list_ids: list[int]):
+        with self._conn:
+            self._conn.executemany("DELETE FROM lists WHERE list_id=?", [(list_id,) for list_id in list_ids])
+
+    async def delete(self, list_ids: list[int]):
+        await self._run(self._delete, list_ids)
+
+    # Сколько дней класс заказывал питание и сколько всего порций за период [date_from, date_to)
+    def _class_meals(self, date_from: str, date_to: str) -> list[ClassMeals]:
+        rows = self._conn.execute(
+            f"SELECT class_name, COUNT(DISTINCT list_date), COUNT(*) FROM ({LATEST_MEALS}) "
+            "GROUP BY class_name ORDER BY class_name",
+            (date_from, date_to, date_from, date_to),
+        ).fetchall()
+        return [ClassMeals(*row) for row in rows]
+
+    async def class_meals(self, date_from: str, date_to: str) -> list[ClassMeals]:
+        return await self._run(self._class_meals, date_from, date_to)
+
+    def _student_meals(self, date_from: str, date_to: str) -> list[StudentMeals]:
+        rows = self._conn.execute(
+            f"SELECT class_name, student_id, MAX(last_name), MAX(first_name), COUNT(*) FROM ({LATEST_MEALS}) "
+            "GROUP BY class_name, student_id ORDER BY class_name, MAX(last_name), MAX(first_name)",
+            (date_from, date_to, date_from, date_to),
+        ).fetchall()
+        return [StudentMeals(*row) for row in rows]
+
+    async def student_meals(self, date_from: str, date_to: str) -> list[StudentMeals]:
+        return await self._run(self._student_meals, date_from, date_to)
+
+    async def close(self):
+        async with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
@@ -0,0 +1,208 @@
+import asyncio
+import json
+from abc import ABC, abstractmethod
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from metrics import record_db_time
+
+logger = logging.getLogger(__name__)
+
+
+# Незавершённый список: класс и упорядоченное множество StudentID (dict).
+# Класс хранится вместе с отметками, чтобы после перезапуска они не разошлись.
+class Session(NamedTuple):
+    class_id: Optional[int]
+    selected: dict
+
+
+def empty_session() -> Session:
+    return Session(None, {})
+
+
+# Хранилище незавершённых списков: user_id -> Session
+class SessionStore(ABC):
+    @abstractmethod
+    async def get(self, user_id: int) -> Session:
+        ...
+
+    @abstractmethod
+    async def set(self, user_id: int, session: Session):
+        ...
+
+    @abstractmethod
+    async def delete(self, user_id: int):
+        ...
+
+    async def flush(self):
+        pass
+
+    async def close(self):
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {}
+
+
+# Хранение в памяти с вытеснением давно не используемых (LRU) и устаревших (TTL) записей
+class MemorySessionStore(SessionStore):
+    def __init__(self, maxsize: int = 1000, ttl: float = 12 * 60 * 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.evicted = 0
+        self._items: OrderedDict[int, tuple[Session, float]] = OrderedDict()
+
+    def get_cached(self, user_id: int) -> Optional[Session]:
+        item = self._items.get(user_id)
+        if item is None:
+            return None
+        session, touched_at = item
+        if time.monotonic() - touched_at > self.ttl:
+            del self._items[user_id]
+            self.evicted += 1
+            return None
+        self._items.move_to_end(user_id)
+        return session
+
+    def put(self, user_id: int, session: Session):
+        self._items[user_id] = (session, time.monotonic())
+        self._items.move_to_end(user_id)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+            self.evicted += 1
+
+    async def get(self, user_id: int) -> Session:
+        session = self.get_cached(user_id)
+        return session if session is not None else empty_session()
+
+    async def set(self, user_id: int, session: Session):
+        self.put(user_id, session)
+
+    async def delete(self, user_id: int):
+        self._items.pop(user_id, None)
+
+    def stats(self) -> dict:
+        return {"sessions": len(self._items), "evicted": self.evicted}
+
+
+# Хранение на диске (SQLite) с кэшем в памяти. Изменения копятся и записываются пачкой
+# раз в flush_delay секунд, поэтому частые нажатия не приводят к записи на каждое событие.
+class SqliteSessionStore(SessionStore):
+    def __init__(self, path: str, maxsize: int = 1000, ttl: float = 12 * 60 * 60, flush_delay: float = 5.0):
+        self.path = path
+        self.ttl = ttl
+        self.flush_delay = flush_delay
+        self.flushes = 0
+        self._cache = MemorySessionStore(maxsize=maxsize, ttl=ttl)
+        self._dirty: dict[int, Optional[Session]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = asyncio.Lock()
+
+    # Файл открывается при первом обращении, чтобы импорт модулей бота ничего не создавал на диске
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "user_id INTEGER PRIMARY KEY, class_id INTEGER, selected TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            # Файл прежней версии: отметки без класса — такую сессию бот попросит начать заново
+            columns = {row[1] for row in self._connection.execute("PRAGMA table_info(sessions)")}
+            if "class_id" not in columns:
+                self._connection.execute("ALTER TABLE sessions ADD COLUMN class_id INTEGER")
+            self._connection.commit()
+        return self._connection
+
+    async def _run(self, fn, *args):
+        started = time.perf_counter()
+        try:
+            async with self._lock:
+                return await asyncio.to_thread(fn, *args)
+        finally:
+            record_db_time(time.perf_counter() - started)
+
+    def _load(self, user_id: int) -> Optional[Session]:
+        row = self._conn.execute(
+            "SELECT class_id, selected FROM sessions WHERE user_id=? AND updated_at>=?",
+            (user_id, time.time() - self.ttl),
+        ).fetchone()
+        return Session(row[0], dict.fromkeys(json.loads(row[1]))) if row else None
+
+    async def get(self, user_id: int) -> Session:
+        session = self._cache.get_cached(user_id)
+        if session is not None:
+            return session
+        if user_id in self._dirty:
+            session = self._dirty[user_id]
+        else:
+            session = await self._run(self._load, user_id)
+        if session is None:
+            return empty_session()
+        self._cache.put(user_id, session)
+        return session
+
+    async def set(self, user_id: int, session: Session):
+        self._cache.put(user_id, session)
+        self._dirty[user_id] = session
+        self._schedule_flush()
+
+    async def delete(self, user_id: int):
+        await self._cache.delete(user_id)
+        self._dirty[user_id] = None
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.flush_delay, self._start_flush)
+
+    # Ссылку на задачу храним, иначе сборщик мусора может удалить её до завершения записи
+    def _start_flush(self):
+        self._flush_handle = None
+        self._flush_task = asyncio.create_task(self.flush())
+
+    def _write(self, batch: dict[int, Optional[tuple[Optional[int], str]]]):
+        now = time.time()
+        upserts = [(user_id, *session, now) for user_id, session in batch.items() if session is not None]
+        deletes = [(user_id,) for user_id, session in batch.items() if session is None]
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO sessions (user_id, class_id, selected, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET class_id=excluded.class_id, selected=excluded.selected, "
+                "updated_at=excluded.updated_at",
+                upserts,
+            )
+            self._conn.executemany("DELETE FROM sessions WHERE user_id=?", deletes)
+            self._conn.execute("DELETE FROM sessions WHERE updated_at<?", (now - self.ttl,))
+
+    async def flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._dirty:
+            return
+        # Сериализуем в цикле событий, чтобы обработчики не меняли словари во время записи
+        batch = {user_id: (session.class_id, json.dumps(list(session.selected))) if session is not None else None
+                 for user_id, session in self._dirty.items()}
+        self._dirty = {}
+        await self._run(self._write, batch)
+        self.flushes += 1
+        logger.debug(f"Сохранено сессий: {len(batch)}")
+
+    async def close(self):
+        if self._flush_task is not None:
+            await self._flush_task
+            self._flush_task = None
+        await self.flush()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def stats(self) -> dict:
+        return {**self._cache.stats(), "dirty": len(self._dirty), "flushes": self.flushes}
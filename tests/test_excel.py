@@ -0,0 +1,33 @@
+import io
+
+import pytest
+
+import excel
+from db import StudentRow
+from saved_lists import ListRecord
+
+openpyxl = pytest.importorskip("openpyxl")
+
+
+def entry(class_name: str) -> ListRecord:
+    return ListRecord(1, 1, None, class_name, "2026-10-01", (StudentRow(1, "Иванов", "Иван"),),
+                      "2026-10-01T08:30:00", None, None)
+
+
+def test_report_sheet_titles_are_valid_and_unique():
+    long_name = "Очень длинное название класса номер"
+    entries = [entry("5/А"), entry("Итого"), entry(long_name + " 1"), entry(long_name + " 2"), entry("[?]")]
+    data = excel.render_report("2026-10-01", entries)
+    titles = openpyxl.load_workbook(io.BytesIO(data)).sheetnames
+    assert titles[0] == "Итого"
+    assert len({t.lower() for t in titles}) == len(titles) == 6
+    assert all(len(t) <= 31 and not set(t) & set("\\/?*[]:") for t in titles)
+    assert "5-А" in titles
+
+
+def test_list_file_name_is_safe_for_the_file_system(tmp_path, monkeypatch):
+    monkeypatch.setattr(excel.config, "USER_FILES_DIR", str(tmp_path))
+    assert excel.list_file_name("5/А", "2026-10-01") == "5-А_2026-10-01.xlsx"
+    assert excel.list_file_name('..\\10:"Б"', "2026-10-01") == "-10--Б-_2026-10-01.xlsx"
+    path = excel.save_list(42, "5/А", "2026-10-01", b"xlsx")
+    assert path == str(tmp_path / "42" / "5-А_2026-10-01.xlsx")
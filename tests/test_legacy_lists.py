@@ -0,0 +1,92 @@
+import asyncio
+import os
+
+import pytest
+
+from db import SqliteDatabase, StudentRow
+from legacy_lists import migrate_user_files
+from roster import RosterCache
+from saved_lists import ListStore
+
+openpyxl = pytest.importorskip("openpyxl")
+
+
+def write_old_list(path, names):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["Фамилия ученика", "Имя ученика"])
+    for name in names:
+        ws.append(list(name))
+    ws.append(["Итого", len(names)])
+    wb.save(path)
+
+
+def test_old_xlsx_lists_are_imported_once(tmp_path):
+    async def run():
+        db = SqliteDatabase()
+        await db.execute("INSERT INTO Classes (ClassID, ClassName) VALUES (1, '5А')")
+        await db.execute("INSERT INTO Students (StudentID, LastName, FirstName, ClassID) VALUES (1, 'Иванов', 'Иван', 1)")
+        await db.execute("INSERT INTO Students (StudentID, LastName, FirstName, ClassID) VALUES (2, 'Петров', 'Пётр', 1)")
+        roster = RosterCache(db, ttl=60)
+        store = ListStore(str(tmp_path / "lists.sqlite3"))
+
+        folder = tmp_path / "user_files" / "42"
+        folder.mkdir(parents=True)
+        write_old_list(folder / "5А_2026-10-01.xlsx", [("Петров", "Пётр"), ("Уехавший", "Ученик")])
+        (folder / "notes.txt").write_text("не список")
+
+        base = str(tmp_path / "user_files")
+        first = await migrate_user_files(store, roster, base)
+        second = await migrate_user_files(store, roster, base)
+        records = await store.user_lists(42)
+        found = await store.find_by_path(42, os.path.join(base, "42", "5А_2026-10-01.xlsx"))
+        meals = await store.class_meals("2026-10-01", "2026-11-01")
+        await store.close()
+        db.close()
+        return first, second, records, found, meals
+
+    first, second, records, found, meals = asyncio.run(run())
+    assert (first, second) == (1, 0)
+    assert len(records) == 1
+    record = records[0]
+    assert (record.class_id, record.class_name, record.list_date) == (1, "5А", "2026-10-01")
+    assert record.students == (StudentRow(2, "Петров", "Пётр"),)
+    assert found == record
+    assert [(m.class_name, m.meals) for m in meals] == [("5А", 1)]
+
+
+def test_unreadable_old_files_are_not_read_again(tmp_path, monkeypatch):
+    import legacy_lists
+
+    reads = []
+    read_names = legacy_lists._read_names
+
+    def counting_read_names(file_path):
+        reads.append(os.path.basename(file_path))
+        return read_names(file_path)
+
+    monkeypatch.setattr(legacy_lists, "_read_names", counting_read_names)
+
+    async def run():
+        db = SqliteDatabase()
+        await db.execute("INSERT INTO Classes (ClassID, ClassName) VALUES (1, '5А')")
+        roster = RosterCache(db, ttl=60)
+        store = ListStore(str(tmp_path / "lists.sqlite3"))
+
+        folder = tmp_path / "user_files" / "42"
+        folder.mkdir(parents=True)
+        (folder / "5А_2026-10-01.xlsx").write_bytes(b"not a workbook")
+        write_old_list(folder / "5А_2026-10-02.xlsx", [("Уехавший", "Ученик")])
+
+        base = str(tmp_path / "user_files")
+        first = await migrate_user_files(store, roster, base)
+        second = await migrate_user_files(store, roster, base)
+        skipped = await store.skipped_files()
+        await store.close()
+        db.close()
+        return first, second, skipped
+
+    first, second, skipped = asyncio.run(run())
+    assert (first, second) == (0, 0)
+    assert sorted(reads) == ["5А_2026-10-01.xlsx", "5А_2026-10-02.xlsx"]
+    assert len(skipped) == 2
@@ -0,0 +1,67 @@
+import asyncio
+
+from outbound import OutboundLimiter
+
+
+def test_queued_edits_of_one_message_are_coalesced():
+    async def run():
+        limiter = OutboundLimiter(overall_rate=30, chat_rate=20, chat_burst=1)
+        sent = []
+
+        async def callback(markup):
+            sent.append(markup)
+            return True
+
+        data = {"chat_id": 1, "message_id": 7}
+        results = await asyncio.gather(*(
+            limiter.process_request(callback, (i,), {}, "editMessageReplyMarkup", data, None) for i in range(5)
+        ))
+        return limiter, sent, results
+
+    limiter, sent, results = asyncio.run(run())
+    # Первая правка ушла сразу, из ожидавших в очереди отправлена только последняя
+    assert sent == [0, 4]
+    assert results == [True] * 5
+    assert limiter.coalesced == 3
+
+
+def test_edits_of_different_messages_are_not_coalesced():
+    async def run():
+        limiter = OutboundLimiter(overall_rate=30, chat_rate=20, chat_burst=1)
+        sent = []
+
+        async def callback(message_id):
+            sent.append(message_id)
+
+        await asyncio.gather(*(
+            limiter.process_request(callback, (i,), {}, "editMessageReplyMarkup",
+                                    {"chat_id": 1, "message_id": i}, None) for i in range(3)
+        ))
+        return limiter, sent
+
+    limiter, sent = asyncio.run(run())
+    assert sorted(sent) == [0, 1, 2]
+    assert limiter.coalesced == 0
+
+
+def test_waiting_document_does_not_hold_back_other_chats():
+    async def run():
+        limiter = OutboundLimiter(overall_rate=30, chat_rate=1, chat_burst=1)
+
+        async def callback():
+            return True
+
+        documents = [asyncio.create_task(limiter.process_request(callback, (), {}, "sendDocument",
+                                                                 {"chat_id": 1}, None)) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await limiter.process_request(callback, (), {}, "answerCallbackQuery", {}, None)
+        await limiter.process_request(callback, (), {}, "sendMessage", {"chat_id": 2}, None)
+        elapsed = loop.time() - started
+        for task in documents:
+            task.cancel()
+        await asyncio.gather(*documents, return_exceptions=True)
+        return elapsed
+
+    assert asyncio.run(run()) < 0.5
@@ -0,0 +1,53 @@
+import asyncio
+import os
+import time
+from datetime import date
+
+from db import StudentRow
+from retention import RetentionSweeper
+from saved_lists import ListStore
+
+
+def touch(path, days_old: float):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * 10)
+    mtime = time.time() - days_old * 24 * 60 * 60
+    os.utime(path, (mtime, mtime))
+
+
+def test_sweep_removes_expired_lists_and_old_orphan_files(tmp_path):
+    files_dir = tmp_path / "user_files"
+    indexed_old = files_dir / "1" / "5А_2026-01-01.xlsx"
+    indexed_recent = files_dir / "1" / "5А_2026-10-10.xlsx"
+    orphan_old = files_dir / "2" / "6Б_2025-12-01.xlsx"
+    orphan_fresh = files_dir / "2" / "6Б_2026-10-11.xlsx"
+    # Всё, что не похоже на список пользователя, остаётся на месте
+    foreign = [files_dir / "lists.sqlite3", files_dir / "2" / "notes.txt",
+               files_dir / "archive" / "5А_2025-12-01.xlsx", files_dir / "2" / "old" / "5А_2025-12-01.xlsx"]
+    for path, days_old in ((indexed_old, 30), (indexed_recent, 30), (orphan_old, 30), (orphan_fresh, 1)):
+        touch(path, days_old)
+    for path in foreign:
+        touch(path, 30)
+
+    async def run():
+        store = ListStore(str(tmp_path / "lists.sqlite3"))
+        student = [StudentRow(1, "Иванов", "Иван")]
+        for list_date, path in (("2026-01-01", indexed_old), ("2026-10-10", indexed_recent)):
+            list_id = await store.add(1, 1, "5А", list_date, student)
+            await store.set_file_path(list_id, str(path))
+        sweeper = RetentionSweeper(store, retention_days=7, files_dir=str(files_dir))
+        result = await sweeper.sweep(today=date(2026, 10, 12))
+        remaining = await store.user_lists(1)
+        await store.close()
+        return result, remaining
+
+    result, remaining = asyncio.run(run())
+    assert result["lists"] == 1
+    assert result["files"] == 2
+    assert [r.list_date for r in remaining] == ["2026-10-10"]
+    # Файл списка в пределах срока хранения остаётся, хотя сам файл старый
+    assert indexed_recent.exists()
+    assert orphan_fresh.exists()
+    assert not orphan_old.exists() and not indexed_old.exists()
+    assert all(path.exists() for path in foreign)
+    assert files_dir.exists()
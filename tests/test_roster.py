@@ -0,0 +1,29 @@
+import asyncio
+
+import roster
+from db import ClassRow, StudentRow
+from roster import RosterCache
+
+
+def test_concurrent_cold_misses_load_roster_once(monkeypatch):
+    loads = []
+
+    async def get_classes(db):
+        loads.append("classes")
+        await asyncio.sleep(0.01)
+        return [ClassRow(1, "5А")]
+
+    async def get_all_students(db):
+        return [(1, StudentRow(10, "Иванов", "Иван"))]
+
+    monkeypatch.setattr(roster.repo, "get_classes", get_classes)
+    monkeypatch.setattr(roster.repo, "get_all_students", get_all_students)
+
+    async def run():
+        cache = RosterCache(db=None)
+        return cache, await asyncio.gather(*(cache.students(1) for _ in range(10)))
+
+    cache, results = asyncio.run(run())
+    assert loads == ["classes"]
+    assert all(students == (StudentRow(10, "Иванов", "Иван"),) for students in results)
+    assert cache.stats()["misses"] == 10
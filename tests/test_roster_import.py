@@ -0,0 +1,97 @@
+import io
+
+import pytest
+
+from db import ClassRow, StudentRow
+from roster_import import ImportRow, diff_roster, read_roster
+
+CLASSES = [ClassRow(1, "5А"), ClassRow(2, "5Б"), ClassRow(3, "6А")]
+STUDENTS = [
+    (1, StudentRow(1, "Иванов", "Иван")),
+    (1, StudentRow(2, "Петров", "Пётр")),
+    (2, StudentRow(3, "Сидоров", "Сидр")),
+    (2, StudentRow(4, "Смирнова", "Анна")),
+    (3, StudentRow(5, "Кузнецов", "Олег")),
+]
+
+
+def row(class_name, last_name, first_name, student_id=None):
+    return ImportRow(class_name, last_name, first_name, student_id)
+
+
+def test_file_with_one_class_keeps_other_classes():
+    diff = diff_roster(CLASSES, STUDENTS, [row("5А", "Иванов", "Иван")])
+    assert diff.deletes == [2]
+    assert diff.inserts == [] and diff.updates == []
+    assert diff.unchanged == 1
+
+
+def test_full_sync_deletes_students_missing_from_file():
+    diff = diff_roster(CLASSES, STUDENTS, [row("5А", "Иванов", "Иван")], full_sync=True)
+    assert sorted(diff.deletes) == [2, 3, 4, 5]
+
+
+def test_file_without_students_is_rejected():
+    with pytest.raises(ValueError):
+        diff_roster(CLASSES, STUDENTS, [], full_sync=True)
+
+
+def test_transfer_to_another_class_is_an_update():
+    rows = [row("5А", "Иванов", "Иван"), row("5А", "Петров", "Пётр"), row("5А", "Сидоров", "Сидр")]
+    diff = diff_roster(CLASSES, STUDENTS, rows)
+    assert diff.updates == [(3, rows[2])]
+    # Класс 5Б в файле не упоминается, поэтому оставшиеся в нём ученики не удаляются
+    assert diff.deletes == []
+
+
+def test_ambiguous_name_is_inserted_not_moved():
+    students = STUDENTS + [(3, StudentRow(6, "Иванов", "Иван"))]
+    rows = [row("5Б", "Иванов", "Иван"), row("5Б", "Сидоров", "Сидр"), row("5Б", "Смирнова", "Анна")]
+    diff = diff_roster(CLASSES, students, rows)
+    assert diff.inserts == [rows[0]]
+    assert diff.updates == [] and diff.deletes == []
+
+
+def test_match_by_student_id_and_new_class():
+    rows = [row("7В", "Кузнецов", "Олег", 5), row("7В", "Новиков", "Ник")]
+    diff = diff_roster(CLASSES, STUDENTS, rows)
+    assert diff.new_classes == ["7В"]
+    assert diff.updates == [(5, rows[0])]
+    assert diff.inserts == [rows[1]]
+    assert diff.deletes == []
+
+
+def read(text: str, name: str = "roster.csv"):
+    return list(read_roster(io.BytesIO(text.encode("utf-8-sig")), name))
+
+
+def test_read_csv_with_semicolons_and_aliases():
+    rows = read("Класс;Фамилия;Имя;StudentID\n5А;Иванов;Иван;1\n\n5Б;Петров;Пётр;\n")
+    assert rows == [row("5А", "Иванов", "Иван", 1), row("5Б", "Петров", "Пётр")]
+
+
+@pytest.mark.parametrize("line", ["; Иванов; Иван", "5А;;Иван", "5А;Иванов;"])
+def test_blank_required_cell_rejects_file(line):
+    with pytest.raises(ValueError, match="строка 2"):
+        read(f"Класс;Фамилия;Имя\n{line}\n5А;Петров;Пётр\n")
+
+
+def test_missing_columns_and_unparseable_csv_raise_value_error():
+    with pytest.raises(ValueError, match="нет столбцов"):
+        read("a,b\n1,2\n")
+    with pytest.raises(ValueError):
+        read("")
+    with pytest.raises(ValueError):
+        read('Класс,Фамилия,Имя\n5А,"Иванов\n')
+
+
+def test_read_xlsx():
+    openpyxl = pytest.importorskip("openpyxl")
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["ClassName", "LastName", "FirstName"])
+    ws.append(["5А", "Иванов", "Иван"])
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    buffer.seek(0)
+    assert list(read_roster(buffer, "roster.xlsx")) == [row("5А", "Иванов", "Иван")]
@@ -0,0 +1,99 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from sessions import MemorySessionStore, Session, SessionStore, SqliteSessionStore
+
+
+def test_base_store_is_abstract():
+    with pytest.raises(TypeError):
+        SessionStore()
+
+
+def test_memory_store_evicts_least_recently_used():
+    async def run():
+        store = MemorySessionStore(maxsize=2)
+        await store.set(1, Session(10, {1: None}))
+        await store.set(2, Session(10, {2: None}))
+        await store.get(1)
+        await store.set(3, Session(10, {3: None}))
+        return store, [await store.get(user_id) for user_id in (1, 2, 3)]
+
+    store, result = asyncio.run(run())
+    # Пользователь 1 обращался недавно, поэтому вытеснен пользователь 2
+    assert result == [Session(10, {1: None}), Session(None, {}), Session(10, {3: None})]
+    assert store.evicted == 1
+
+
+def test_memory_store_expires_by_ttl():
+    async def run():
+        store = MemorySessionStore(ttl=0.1)
+        await store.set(1, Session(10, {1: None}))
+        fresh = await store.get(1)
+        await asyncio.sleep(0.15)
+        return store, fresh, await store.get(1)
+
+    store, fresh, expired = asyncio.run(run())
+    assert fresh == Session(10, {1: None})
+    assert expired == Session(None, {})
+    assert store.evicted == 1
+
+
+def test_sqlite_store_writes_changes_in_one_batch(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+
+    async def run():
+        store = SqliteSessionStore(path, flush_delay=0.05)
+        for page in range(5):
+            await store.set(1, Session(10, dict.fromkeys(range(page + 1))))
+        await store.set(2, Session(11, {7: None}))
+        await store.delete(2)
+        dirty = store.stats()["dirty"]
+        await asyncio.sleep(0.2)
+        flushes = store.flushes
+        await store.close()
+        return dirty, flushes
+
+    dirty, flushes = asyncio.run(run())
+    assert dirty == 2
+    assert flushes == 1
+    rows = sqlite3.connect(path).execute("SELECT user_id, class_id, selected FROM sessions").fetchall()
+    assert rows == [(1, 10, "[0, 1, 2, 3, 4]")]
+
+
+def test_sqlite_store_restores_session_after_restart(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+
+    async def run():
+        store = SqliteSessionStore(path, flush_delay=60)
+        await store.set(1, Session(10, {5: None, 3: None}))
+        # Запись ещё не ушла на диск: её сохраняет закрытие при остановке бота
+        await store.close()
+
+        restarted = SqliteSessionStore(path)
+        session = await restarted.get(1)
+        missing = await restarted.get(2)
+        await restarted.close()
+        return session, missing
+
+    session, missing = asyncio.run(run())
+    assert session == Session(10, {5: None, 3: None})
+    assert list(session.selected) == [5, 3]
+    assert missing == Session(None, {})
+
+
+def test_sqlite_store_drops_expired_sessions_on_load(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+
+    async def run():
+        store = SqliteSessionStore(path, ttl=0.1)
+        await store.set(1, Session(10, {1: None}))
+        await store.close()
+        await asyncio.sleep(0.15)
+        restarted = SqliteSessionStore(path, ttl=0.1)
+        session = await restarted.get(1)
+        await restarted.close()
+        return session
+
+    assert asyncio.run(run()) == Session(None, {})
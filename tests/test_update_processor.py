@@ -0,0 +1,71 @@
+import asyncio
+from types import SimpleNamespace
+
+from update_processor import PerUserUpdateProcessor
+
+
+def update_from(user_id: int):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id), effective_chat=None)
+
+
+class Recorder:
+    def __init__(self):
+        self.events = []
+        self.running = 0
+        self.peak = 0
+
+    async def handle(self, user_id: int, n: int, delay: float = 0.02):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        self.events.append(("start", user_id, n))
+        await asyncio.sleep(delay)
+        self.events.append(("end", user_id, n))
+        self.running -= 1
+
+
+def test_updates_of_one_user_run_in_order():
+    async def run():
+        processor = PerUserUpdateProcessor(max_concurrent_updates=8)
+        recorder = Recorder()
+        # Первое нажатие обрабатывается дольше остальных, но они всё равно ждут его
+        await asyncio.gather(*(
+            processor.process_update(update_from(1), recorder.handle(1, n, delay=0.05 if n == 0 else 0.01))
+            for n in range(4)
+        ))
+        return processor, recorder
+
+    processor, recorder = asyncio.run(run())
+    expected = [event for n in range(4) for event in (("start", 1, n), ("end", 1, n))]
+    assert recorder.events == expected
+    assert recorder.peak == 1
+    assert processor.stats() == {"users": 0, "pending": 0}
+
+
+def test_different_users_run_concurrently():
+    async def run():
+        processor = PerUserUpdateProcessor(max_concurrent_updates=8)
+        recorder = Recorder()
+        await asyncio.gather(*(
+            processor.process_update(update_from(user_id), recorder.handle(user_id, 0)) for user_id in range(4)
+        ))
+        return recorder
+
+    recorder = asyncio.run(run())
+    assert recorder.peak == 4
+    # Все начали работу до того, как кто-то закончил
+    assert [kind for kind, _, _ in recorder.events[:4]] == ["start"] * 4
+
+
+def test_global_limit_holds():
+    async def run():
+        processor = PerUserUpdateProcessor(max_concurrent_updates=2)
+        recorder = Recorder()
+        await asyncio.gather(*(
+            processor.process_update(update_from(user_id), recorder.handle(user_id, n))
+            for user_id in range(5) for n in range(2)
+        ))
+        return recorder
+
+    recorder = asyncio.run(run())
+    assert recorder.peak == 2
+    assert len(recorder.events) == 20
@@ -0,0 +1,58 @@
+import asyncio
+from typing import Optional
+
+from telegram.ext import BaseUpdateProcessor
+
+# Лимит базового класса: фактически без ограничения
+UNBOUNDED = 1_000_000
+
+
+# Параллельная обработка обновлений разных пользователей. Обновления одного пользователя
+# выполняются строго по очереди, поэтому долгая выгрузка Excel одного учителя
+# не задерживает нажатия остальных, а нажатия одного учителя не перемешиваются.
+# Общий лимит PTB берёт слот ещё до очереди пользователя, поэтому он отключён:
+# свой семафор захватывается только после блокировки пользователя, и ожидающие
+# в очереди нажатия одного учителя не занимают слоты остальных.
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates: int = 64):
+        super().__init__(UNBOUNDED)
+        self.limit = max_concurrent_updates
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._pending: dict[int, int] = {}
+
+    @staticmethod
+    def _key(update) -> Optional[int]:
+        user = getattr(update, "effective_user", None)
+        if user is not None:
+            return user.id
+        chat = getattr(update, "effective_chat", None)
+        return chat.id if chat is not None else None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._pending[key] = self._pending.get(key, 0) + 1
+        try:
+            async with lock:
+                async with self._slots:
+                    await coroutine
+        finally:
+            self._pending[key] -= 1
+            if not self._pending[key]:
+                del self._pending[key]
+                del self._locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"users": len(self._pending), "pending": sum(self._pending.values())}